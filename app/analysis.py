@@ -5,47 +5,119 @@ import os
 import cv2
 import json
 import time
+import cProfile
+import itertools
+import subprocess
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 import requests
 import yt_dlp
+from redis import Redis
+from redis.exceptions import RedisError
+from rq.timeouts import JobTimeoutException
 import numpy as np
-import easyocr
 from datetime import datetime
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+
+from app.resources import get_shared_resources, UI_TEMPLATES
+from app.storage import FrameDataWriter, artifact_path, RESULTS_FOLDER
+from app.post_analysis import render_visualization
+from app.hunt_areas import find_hunt_areas
+from app.sampling import FrameSampler, sampling_step
+from app.ocr_cache import NameRecognizer
+from app.change_detection import RegionChangeDetector
+from app.progress import ProgressPublisher
+from app.metrics import StageTimer, publish_job_metrics, publish_job_timing
+from app.scheduling import current_queue_wait, will_retry
+from app.result_cache import cached_files, evict, RESULT_CACHE_MAX_MB
+from app.batch import BatchFrameAnalyzer, ENTRY_HEIGHT, EMPTY_ROW_MEAN, TARGET_MARKER_MEAN, HP_BAR_HSV, MANA_BAR_HSV, CREATURE_HP_HSV
 
 # --- Konfiguracja Aplikacji dla Workera ---
 # Worker potrzebuje kontekstu aplikacji, aby połączyć się z bazą danych.
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join('app', 'database', 'app.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
 
-# Import modeli po inicjalizacji db
-from app.main import Job, FrameData
+# Import modeli i wspólnej instancji db - Job i FrameData muszą korzystać z tej samej sesji
+from app.main import db, Job, FrameData, BattleListEntry, load_path_coords, iter_frame_rows, find_cached_result, complete_from_cache, publish_cache_stats
+db.init_app(app)
+redis_conn = Redis.from_url(os.getenv('REDIS_URL', 'redis://redis:6379'))
+UPLOAD_FOLDER = os.path.join('app', 'uploads')
+
+# Liczba procesów analizujących jedno wideo równolegle (tryb segmentowy). 1 = analiza sekwencyjna.
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', '1'))
+# Minimalna długość segmentu w klatkach - krótszych wideo nie opłaca się dzielić
+SEGMENT_MIN_FRAMES = int(os.getenv('SEGMENT_MIN_FRAMES', '1500'))
+# Co ile sekund publikować postęp zadania w Redis (strumień SSE na stronie WWW)
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', '1'))
+# Co ile sekund zapisywać postęp również do bazy (niezależnie od zapisu wyników klatek)
+PROGRESS_DB_INTERVAL = float(os.getenv('PROGRESS_DB_INTERVAL', '30'))
+# Analiza strumieniowa źródeł URL/YouTube: klatki są dekodowane wprost ze strumienia HTTP, bez pliku tymczasowego
+STREAMING_INGEST = os.getenv('STREAMING_INGEST', '0') == '1'
+# Profilowanie zadań przez cProfile (app/output/<job_id>.prof). W trybie segmentowym obejmuje tylko proces nadrzędny.
+PROFILE_JOBS = os.getenv('PROFILE_JOBS', '0') == '1'
+# Analiza wsadowa wielu nagrań: liczba klatek w jednej paczce i liczba nagrań analizowanych jednocześnie
+BATCH_FRAMES = int(os.getenv('BATCH_FRAMES', '64'))
+BATCH_LANES = int(os.getenv('BATCH_LANES', '8'))
+# Odporne śledzenie pozycji: ponowne wykrywanie punktów, dopasowanie lokalne przed wyszukiwaniem na całej mapie
+# i okresowa korekta dryfu przepływu optycznego (0 = samo śledzenie przepływem, jak dawniej)
+ROBUST_TRACKING = os.getenv('ROBUST_TRACKING', '1') == '1'
+TRACKING_MIN_POINTS = 6   # mniej śledzonych punktów = utrata śledzenia
+LOCAL_SEARCH_RADIUS = 16  # okno (px) dopasowania wokół ostatniej pozycji po utracie śledzenia
+SNAP_INTERVAL = int(os.getenv('SNAP_INTERVAL', '30'))  # co ile śledzonych klatek korygować dryf
+SNAP_RADIUS = 4  # okno (px) korekty dryfu wokół pozycji z przepływu optycznego
+LOCAL_MATCH_SCORE = 0.7
 
 class TibiaFrameAnalyzer:
-    """Klasa analizująca klatki wideo z gry Tibia."""
-    def __init__(self, world_map_path, lang='en'):
-        self.world_map = cv2.imread(world_map_path)
-        if self.world_map is None: raise FileNotFoundError(f"Nie można wczytać mapy: {world_map_path}")
-        self.world_map_gray = cv2.cvtColor(self.world_map, cv2.COLOR_BGR2GRAY)
-        self.ocr_reader = easyocr.Reader([lang])
+    """Klasa analizująca klatki wideo z gry Tibia.
+    Kosztowne zasoby (mapa, indeks, OCR, szablony) pochodzą ze współdzielonego AnalyzerResources,
+    a sam analizator trzyma tylko lekki stan jednego zadania (śledzenie, cache nazw, ostatnie wyniki).
+    Czasy etapów analizy klatki i liczniki relokalizacji/utraty śledzenia trafiają do timer (StageTimer)."""
+    def __init__(self, world_map_path='map.png', lang='en', resources=None, timer=None):
+        self.resources = resources or get_shared_resources(world_map_path, lang)
+        self.world_map_gray = self.resources.world_map_gray
+        self.map_index = self.resources.map_index
+        self.ocr_reader = self.resources.ocr_reader
+        self.name_recognizer = NameRecognizer(self.ocr_reader)
         self.last_frame_gray = None
         self.last_known_position = None
         self.tracking_points = None
+        self.detected_points = 0
+        self.frames_since_snap = 0
         self.feature_params = dict(maxCorners=100, qualityLevel=0.3, minDistance=7, blockSize=7)
         self.lk_params = dict(winSize=(15, 15), maxLevel=2, criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
         self.ui_positions_cache = {}
+        # Pomijanie śledzenia pozycji, gdy minimapa się nie zmieniła (paski i battle lista są odczytywane zawsze,
+        # a OCR niezmienionych nazw pomija cache NameRecognizer)
+        self.change_detector = RegionChangeDetector()
+        self.timer = timer or StageTimer()
+
+    def reset_tracking(self):
+        """Zapomina stan śledzenia - kolejna klatka wymusi pełne wyszukiwanie pozycji na mapie."""
+        self.last_frame_gray = None
+        self.last_known_position = None
+        self.tracking_points = None
+        self.frames_since_snap = 0
+        self.change_detector.reset()
+
+    def pop_metrics(self):
+        """Zwraca i zeruje liczniki analizatora zebrane od poprzedniego wywołania."""
+        return {**self.name_recognizer.pop_metrics(), **self.change_detector.pop_metrics()}
 
     # ... (metody _find_ui_element, _extract_minimap, _detect_position, _analyze_battle_list
     #      pozostają takie same jak w poprzedniej wersji - dla zwięzłości pominięto) ...
-    def _find_ui_element(self, frame_gray, template_path, cache_key):
+    def _find_ui_element(self, frame, template_path, cache_key):
+        """Położenie elementu interfejsu (x, y, w, h). Klatka jest konwertowana do skali szarości tylko przy wyszukiwaniu szablonu."""
         if cache_key in self.ui_positions_cache: return self.ui_positions_cache[cache_key]
-        template = cv2.imread(template_path, 0)
+        template = self.resources.template(template_path)
         if template is None:
-            if cache_key == 'minimap': return (frame_gray.shape[1] - 160, 10, 150, 150)
-            if cache_key == 'battle_list': return (frame_gray.shape[1] - 160, 170, 150, 300)
-            return None
+            # Bez szablonu położenie zależy tylko od szerokości klatki - stałej w obrębie nagrania
+            if cache_key == 'minimap': pos = (frame.shape[1] - 160, 10, 150, 150)
+            elif cache_key == 'battle_list': pos = (frame.shape[1] - 160, 170, 150, 300)
+            else: return None
+            self.ui_positions_cache[cache_key] = pos
+            return pos
+        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         res = cv2.matchTemplate(frame_gray, template, cv2.TM_CCOEFF_NORMED)
         _, max_val, _, max_loc = cv2.minMaxLoc(res)
         if max_val > 0.8:
@@ -57,74 +129,149 @@ class TibiaFrameAnalyzer:
             return pos
         return None
 
-    def _extract_minimap(self, frame, frame_gray):
-        pos = self._find_ui_element(frame_gray, 'app/templates/assets/minimap_corner.png', 'minimap')
+    def _extract_minimap(self, frame):
+        pos = self._find_ui_element(frame, UI_TEMPLATES['minimap'], 'minimap')
         if pos: x, y, w, h = pos; return frame[y:y+h, x:x+w]
         return None
 
     def _detect_position(self, minimap_gray):
         if minimap_gray is None or minimap_gray.size == 0: return None
-        result = cv2.matchTemplate(self.world_map_gray, minimap_gray, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, max_loc = cv2.minMaxLoc(result)
-        if max_val >= 0.7:
+        # Wyszukiwanie zgrubne na piramidzie mapy zamiast matchTemplate na całej mapie świata
+        self.timer.count('relocalisations')
+        with self.timer.stage('position'):
+            match = self.map_index.locate(minimap_gray)
+        if match and match[2] >= 0.7:
             w, h = minimap_gray.shape[::-1]
-            self.last_known_position = (max_loc[0], max_loc[1], w, h)
+            self.last_known_position = (match[0], match[1], w, h)
             return self.last_known_position
         return None
         
-    def _analyze_battle_list(self, frame, frame_gray):
-        pos = self._find_ui_element(frame_gray, 'app/templates/assets/battle_list_header.png', 'battle_list')
+    def _analyze_battle_list(self, frame):
+        pos = self._find_ui_element(frame, UI_TEMPLATES['battle_list'], 'battle_list')
         if not pos: return []
         x, y, w, h = pos
-        battle_list_roi = frame[y:y+h, x:x+w]
-        entities, entry_height = [], 22
-        for i in range(h // entry_height):
-            entry_roi = battle_list_roi[i * entry_height:(i + 1) * entry_height, :]
-            if np.mean(entry_roi) < 25: continue
-            ocr_result = self.ocr_reader.readtext(entry_roi[:, 5:], detail=0, paragraph=False)
-            if ocr_result:
-                name = " ".join(ocr_result)
+        return self._read_battle_list(frame[y:y+h, x:x+w], w, h)
+
+    def _read_battle_list(self, battle_list_roi, w, h):
+        entries = [battle_list_roi[i * ENTRY_HEIGHT:(i + 1) * ENTRY_HEIGHT, :] for i in range(h // ENTRY_HEIGHT)]
+        entries = [entry_roi for entry_roi in entries if np.mean(entry_roi) >= EMPTY_ROW_MEAN]
+        if not entries: return []
+        # Wszystkie niepuste wiersze trafiają do rozpoznawania razem; niezmienione nazwy pochodzą z cache
+        with self.timer.stage('battle_list_ocr'):
+            names = self.name_recognizer.read_names([cv2.cvtColor(entry_roi[:, 5:], cv2.COLOR_BGR2GRAY) for entry_roi in entries])
+        entities = []
+        for entry_roi, name in zip(entries, names):
+            if name:
                 hp_bar_roi = entry_roi[12:15, 5:w-5]
                 hsv_hp = cv2.cvtColor(hp_bar_roi, cv2.COLOR_BGR2HSV)
-                mask_health = cv2.inRange(hsv_hp, np.array([30, 100, 100]), np.array([90, 255, 255]))
+                mask_health = cv2.inRange(hsv_hp, *CREATURE_HP_HSV)
                 hp_percent = (cv2.countNonZero(mask_health) / (hp_bar_roi.shape[1] * hp_bar_roi.shape[0])) * 100
-                is_target = np.mean(entry_roi[:, 0:3]) > 100
+                is_target = bool(np.mean(entry_roi[:, 0:3]) > TARGET_MARKER_MEAN)
                 entities.append({"name": name, "hp_percent": round(hp_percent, 2), "is_target": is_target})
         return entities
 
-    def analyze_frame(self, frame):
-        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        minimap_frame = self._extract_minimap(frame, frame_gray)
+    def _track_position(self, minimap_gray):
+        """Śledzi pozycję przepływem optycznym; po utracie śledzenia lokalizuje minimapę na mapie świata.
+        W trybie ROBUST_TRACKING utracone śledzenie najpierw próbujemy odzyskać dopasowaniem w oknie wokół ostatniej
+        pozycji, a co SNAP_INTERVAL klatek pozycja z przepływu jest dopasowywana do mapy w oknie wokół niej,
+        co kasuje narosły dryf przepływu."""
         current_position = None
-        if minimap_frame is not None:
-            minimap_gray = cv2.cvtColor(minimap_frame, cv2.COLOR_BGR2GRAY)
-            if self.last_frame_gray is None or self.last_known_position is None:
-                current_position = self._detect_position(minimap_gray)
-                if current_position: self.tracking_points = cv2.goodFeaturesToTrack(minimap_gray, mask=None, **self.feature_params)
-            else:
-                if self.tracking_points is not None and len(self.tracking_points) > 0:
-                    new_points, status, _ = cv2.calcOpticalFlowPyrLK(self.last_frame_gray, minimap_gray, self.tracking_points, None, **self.lk_params)
-                    good_new = new_points[status == 1]
-                    if len(good_new) > 5:
-                        dx = np.mean(new_points[status==1,0] - self.tracking_points[status==1,0])
-                        dy = np.mean(new_points[status==1,1] - self.tracking_points[status==1,1])
-                        x, y, w, h = self.last_known_position
-                        current_position = (x + dx, y + dy, w, h)
-                        self.last_known_position = current_position
-                        self.tracking_points = good_new.reshape(-1, 1, 2)
-                    else: self.last_known_position = None
-                else: self.last_known_position = None
-            self.last_frame_gray = minimap_gray.copy()
-        
-        battle_list_entities = self._analyze_battle_list(frame, frame_gray)
+        if self.last_frame_gray is None or self.last_known_position is None:
+            current_position = self._detect_position(minimap_gray)
+            if current_position: self._detect_features(minimap_gray)
+        else:
+            self.timer.count('tracking_frames')
+            current_position = self._follow_features(minimap_gray)
+            if ROBUST_TRACKING:
+                if current_position is None:
+                    current_position = self._match_nearby(minimap_gray, self.last_known_position, LOCAL_SEARCH_RADIUS, 'local_relocalisations')
+                elif self.frames_since_snap >= SNAP_INTERVAL:
+                    current_position = self._snap_to_map(minimap_gray, current_position)
+            self.last_known_position = current_position
+            if current_position is None: self.timer.count('tracking_lost')
+        self.last_frame_gray = minimap_gray.copy()
+        return current_position
+
+    def _detect_features(self, minimap_gray):
+        self.tracking_points = cv2.goodFeaturesToTrack(minimap_gray, mask=None, **self.feature_params)
+        self.detected_points = 0 if self.tracking_points is None else len(self.tracking_points)
+        self.frames_since_snap = 0
+
+    def _follow_features(self, minimap_gray):
+        """Nowa pozycja z przesunięcia śledzonych punktów lub None, jeśli zostało ich za mało."""
+        if self.tracking_points is None or not len(self.tracking_points): return None
+        with self.timer.stage('optical_flow'):
+            new_points, status, _ = cv2.calcOpticalFlowPyrLK(self.last_frame_gray, minimap_gray, self.tracking_points, None, **self.lk_params)
+        found = status.ravel() == 1
+        found_count = np.count_nonzero(found)
+        if found_count < TRACKING_MIN_POINTS: return None
+        # Mediana jest odporna na punkty przyklejone do ruchomych znaczników; obraz minimapy przesuwa się przeciwnie do gracza
+        dx, dy = np.median(new_points[found] - self.tracking_points[found], axis=0).ravel()
+        x, y, w, h = self.last_known_position
+        self.frames_since_snap += 1
+        # Punkty uciekają poza minimapę razem z ruchem gracza - po utracie połowy wykrywamy je na nowo
+        if ROBUST_TRACKING and found_count < self.detected_points // 2:
+            self.timer.count('feature_redetections')
+            frames_since_snap = self.frames_since_snap
+            self._detect_features(minimap_gray)
+            self.frames_since_snap = frames_since_snap
+        else: self.tracking_points = new_points[found].reshape(-1, 1, 2)
+        return (x - dx, y - dy, w, h)
+
+    def _match_nearby(self, minimap_gray, centre, radius, counter, max_shift=None):
+        """Dopasowanie minimapy w oknie +/- radius wokół pozycji centre (zamiast wyszukiwania na całej mapie).
+        Dopasowanie przesunięte względem centre o max_shift lub więcej w którejś osi jest odrzucane."""
+        x, y, w, h = centre
+        x, y = round(x), round(y)
+        self.frames_since_snap = 0
+        with self.timer.stage('local_match'):
+            match = self.map_index.match_window(minimap_gray, x, y, radius)
+        if not match or match[2] < LOCAL_MATCH_SCORE: return None
+        if max_shift is not None and max(abs(match[0] - x), abs(match[1] - y)) >= max_shift:
+            self.timer.count(f'{counter}_rejected')
+            return None
+        self.timer.count(counter)
+        self._detect_features(minimap_gray)
+        return (match[0], match[1], w, h)
+
+    def _snap_to_map(self, minimap_gray, estimate):
+        """Korekta dryfu: dopasowanie w oknie wokół pozycji z przepływu optycznego. Maksimum na brzegu okna
+        oznacza, że prawdziwe dopasowanie leży dalej, niż może sięgać dryf (albo to inny fragment mapy) -
+        wtedy zostaje pozycja z przepływu."""
+        return self._match_nearby(minimap_gray, estimate, SNAP_RADIUS, 'drift_snaps', max_shift=SNAP_RADIUS) or estimate
+
+    def _read_status_bars(self, frame):
         h, w, _ = frame.shape
         hp_bar_roi, mana_bar_roi = frame[h-30:h-20, 10:110], frame[h-20:h-10, 10:110]
-        mask_hp = cv2.inRange(cv2.cvtColor(hp_bar_roi, cv2.COLOR_BGR2HSV), np.array([0, 120, 70]), np.array([10, 255, 255]))
-        mask_mana = cv2.inRange(cv2.cvtColor(mana_bar_roi, cv2.COLOR_BGR2HSV), np.array([100, 150, 0]), np.array([140, 255, 255]))
+        mask_hp = cv2.inRange(cv2.cvtColor(hp_bar_roi, cv2.COLOR_BGR2HSV), *HP_BAR_HSV)
+        mask_mana = cv2.inRange(cv2.cvtColor(mana_bar_roi, cv2.COLOR_BGR2HSV), *MANA_BAR_HSV)
         hp_percent = (cv2.countNonZero(mask_hp) / (hp_bar_roi.size / 3)) * 100
         mana_percent = (cv2.countNonZero(mask_mana) / (mana_bar_roi.size / 3)) * 100
-        
-        results = {"player_coords": None, "stats": {"hp": round(hp_percent, 2), "mana": round(mana_percent, 2)}, "battle_list": battle_list_entities}
+        return {"hp": round(hp_percent, 2), "mana": round(mana_percent, 2)}
+
+    def analyze_frame(self, frame):
+        timer = self.timer
+        with timer.stage('minimap'):
+            minimap_frame = self._extract_minimap(frame)
+            minimap_gray = cv2.cvtColor(minimap_frame, cv2.COLOR_BGR2GRAY) if minimap_frame is not None else None
+        with timer.stage('battle_list'):
+            battle_list_entities = self._analyze_battle_list(frame)
+        with timer.stage('status_bars'):
+            stats = self._read_status_bars(frame)
+        return self.analyze_regions(minimap_gray, stats, battle_list_entities)
+
+    def analyze_regions(self, minimap_gray, stats, battle_list_entities):
+        """Ustala pozycję gracza z minimapy i składa wynik klatki z odczytanych już pasków i battle listy
+        (wspólne dla analizy pojedynczych klatek i wsadowej - app.batch)."""
+        current_position = None
+        if minimap_gray is not None:
+            if self.change_detector.changed('minimap', minimap_gray):
+                current_position = self._track_position(minimap_gray)
+            else:
+                # Minimapa bez zmian - gracz stoi w miejscu, pozycja pozostaje ta sama
+                current_position = self.last_known_position
+
+        results = {"player_coords": None, "stats": dict(stats), "battle_list": list(battle_list_entities)}
         if current_position: x, y, w, h = current_position; results["player_coords"] = {"x": round(x + w/2), "y": round(y + h/2), "z": 7}
         return results
 
@@ -135,59 +282,407 @@ def download_video(source_type, source_data, target_path):
     elif source_type == 'youtube':
         with yt_dlp.YoutubeDL({'format': 'best/best', 'outtmpl': target_path}) as ydl: ydl.download([source_data])
 
-def run_analysis(job_id, source_type, source_data, frame_skip, upload_path=None):
-    """Główna funkcja analityczna, uruchamiana przez workera RQ."""
+def resolve_stream(source_type, source_data):
+    """Zwraca (adres strumienia dla dekodera FFmpeg, przewidywana liczba klatek lub 0, jeśli nieznana)."""
+    if source_type == 'url': return source_data, 0
+    # Do analizy wystarczy sam obraz - wybieramy strumień H.264 po HTTP, który dekoder otworzy bezpośrednio
+    ydl_opts = {'format': 'bestvideo[vcodec^=avc1][protocol^=http]/best[protocol^=http]/best', 'quiet': True}
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(source_data, download=False)
+    return info['url'], int((info.get('duration') or 0) * (info.get('fps') or 0))
+
+def _keyframe_positions(video_path, fps):
+    """Zwraca numery klatek kluczowych wideo (przez ffprobe). Pusta lista, jeśli ffprobe jest niedostępny."""
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-skip_frame', 'nokey',
+           '-show_entries', 'frame=best_effort_timestamp_time', '-of', 'csv=p=0', video_path]
+    try:
+        output = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=300).stdout
+    except (OSError, subprocess.SubprocessError):
+        return []
+    return sorted({int(round(float(t) * fps)) for t in output.split() if t and t != 'N/A'})
+
+def split_segments(video_path, total_frames, fps, workers):
+    """Dzieli wideo na segmenty [start, end) wyrównane do klatek kluczowych (jeśli są znane)."""
+    count = min(workers * 2, max(total_frames // SEGMENT_MIN_FRAMES, 1))
+    bounds = [total_frames * i // count for i in range(count)]
+    keyframes = _keyframe_positions(video_path, fps) if count > 1 else []
+    if keyframes:
+        # Każdą granicę przesuwamy na najbliższą klatkę kluczową, żeby seek nie dekodował klatek "na zapas"
+        bounds = sorted({0} | {min(keyframes, key=lambda k: abs(k - b)) for b in bounds[1:]})
+    bounds.append(total_frames)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def _merge_stats(target, source):
+    for name, value in source.items(): target[name] = target.get(name, 0) + value
+
+def iter_sequential_results(video_path, frame_skip, analyzer, start_frame=0, end_frame=None, sample_fps=None, seekable=True, stats=None):
+    """Analizuje wybrane klatki wideo po kolei. Zwraca generator (frame_number, timestamp, wynik).
+    Jeśli podano słownik stats, dopisuje do niego czasy dekodowania i analizy."""
+    cap = cv2.VideoCapture(video_path)
+    sampler = FrameSampler(cap, sampling_step(frame_skip, sample_fps, cap.get(cv2.CAP_PROP_FPS)), start_frame, end_frame, seekable, timer=analyzer.timer)
+    analysis_time = 0.0
+    try:
+        for frame_number, timestamp, frame in sampler:
+            start = time.perf_counter()
+            result = analyzer.analyze_frame(frame)
+            elapsed = time.perf_counter() - start
+            analysis_time += elapsed
+            analyzer.timer.record('analyze_frame', elapsed)
+            yield frame_number, timestamp, result
+    finally:
+        cap.release()
+        if stats is not None: _merge_stats(stats, {**sampler.stats(), **analyzer.pop_metrics(), 'analysis_s': analysis_time})
+
+# Analizator procesu potomnego puli - tworzony raz na proces przez _init_segment_worker
+_segment_analyzer = None
+
+def _init_segment_worker(world_map_path):
+    global _segment_analyzer
+    # Przy starcie przez fork() zasoby wczytane w procesie nadrzędnym są dziedziczone, a nie wczytywane ponownie
+    _segment_analyzer = TibiaFrameAnalyzer(world_map_path)
+
+def analyze_segment(video_path, start_frame, end_frame, frame_skip, sample_fps=None):
+    """Analizuje jeden segment wideo w procesie potomnym, zaczynając od pełnej lokalizacji na mapie.
+    Zwraca (wyniki, statystyki segmentu, czasy etapów segmentu)."""
+    _segment_analyzer.reset_tracking()
+    _segment_analyzer.timer = StageTimer()
+    stats = {}
+    results = list(iter_sequential_results(video_path, frame_skip, _segment_analyzer, start_frame, end_frame, sample_fps, stats=stats))
+    return results, stats, _segment_analyzer.timer
+
+def iter_segmented_results(video_path, frame_skip, workers, world_map_path='map.png', sample_fps=None, stats=None, timer=None, start_frame=0):
+    """Analizuje segmenty wideo w puli procesów i zwraca wyniki w kolejności klatek (od start_frame - przy wznawianiu).
+    Czasy etapów z segmentów są łączone w timer."""
+    cap = cv2.VideoCapture(video_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+    segments = [(max(start, start_frame), end) for start, end in split_segments(video_path, total_frames, fps, workers) if end > start_frame]
+    with ProcessPoolExecutor(max_workers=min(workers, len(segments)), initializer=_init_segment_worker, initargs=(world_map_path,)) as pool:
+        futures = [pool.submit(analyze_segment, video_path, start, end, frame_skip, sample_fps) for start, end in segments]
+        for future in futures:
+            results, segment_stats, segment_timer = future.result()
+            if stats is not None: _merge_stats(stats, segment_stats)
+            if timer is not None: timer.merge(segment_timer)
+            yield from results
+
+def _store_visualization(job, path_coords, hunt_areas):
+    """Rysuje (lub bierze z cache) wizualizację ścieżki i zapisuje nazwę pliku w Job.visualization."""
+    job.visualization = render_visualization(path_coords, 'map.png', RESULTS_FOLDER, hunt_areas) if len(path_coords) > 1 else ''
+
+def render_job_visualization(job_id):
+    """Zadanie RQ zlecane przez stronę wyników dla zadań, które nie mają jeszcze wizualizacji."""
     with app.app_context():
         job = Job.query.get(job_id)
         if not job: return
+        path_coords, timestamps = load_path_coords(job_id, with_timestamps=True)
+        # Starsze zadania nie mają zapisanych obszarów polowania - wyznaczamy je z artefaktu
+        if job.hunt_areas_json is None: job.hunt_areas_json = json.dumps(find_hunt_areas(path_coords, timestamps))
+        _store_visualization(job, path_coords, json.loads(job.hunt_areas_json))
+        db.session.commit()
+
+def _publish_job_timing(kind, queue_name, seconds):
+    """Dopisuje czas oczekiwania w kolejce lub trwania przebiegu zadania do histogramów /metrics (tylko w workerze RQ)."""
+    if queue_name is None: return
+    try:
+        publish_job_timing(redis_conn, kind, queue_name, seconds)
+    except RedisError as e:
+        print(f"Nie udało się zapisać czasu zadania ({kind}): {e}")
+
+def _checkpoint(job):
+    """Callback FrameDataWriter.on_flush: punkt kontrolny zadania zapisywany w tej samej transakcji co paczka wyników."""
+    return lambda frame_number: setattr(job, 'last_frame', frame_number)
+
+def _resume_results(job, writer):
+    """Przygotowuje wznowienie zadania: usuwa wyniki zapisane po punkcie kontrolnym Job.last_frame, a wcześniejsze
+    dołącza do writer (artefakt, obszary polowania i wizualizacja obejmą całe nagranie).
+    Zwraca numer klatki, od której należy kontynuować analizę."""
+    for model in (FrameData, BattleListEntry):
+        query = model.query.filter(model.job_id == job.id)
+        if job.last_frame is not None: query = query.filter(model.frame_number > job.last_frame)
+        query.delete(synchronize_session=False)
+    db.session.commit()
+    if job.last_frame is None: return 0
+    for rows in iter_frame_rows(job.id): writer.restore([dict(row._mapping) for row in rows])
+    print(f"Wznawianie zadania {job.id} od klatki {job.last_frame + 1}")
+    return job.last_frame + 1
+
+def _evict_result_cache():
+    """Pilnuje limitu RESULT_CACHE_MAX_MB: usuwa najdawniej używane nagrania i artefakty zadań, które się już zakończyły
+    (wyniki w bazie zostają - bez artefaktu strona wyników czyta je z kolumn FrameData)."""
+    files, max_bytes = cached_files(UPLOAD_FOLDER, RESULTS_FOLDER), RESULT_CACHE_MAX_MB << 20
+    if sum(size for _, _, size, _ in files) <= max_bytes: return
+    active = {job_id for job_id, in db.session.query(Job.id).filter(Job.status.in_(('queued', 'processing')))}
+    removed, freed = evict(files, max_bytes, lambda job_id: job_id not in active)
+    if removed:
+        publish_cache_stats(evicted_files=removed, evicted_bytes=freed)
+        print(f"Cache wyników: usunięto {removed} plików ({freed >> 20} MB)")
+
+def _publish_job_metrics(job_id, timer, status):
+    """Dopisuje metryki zadania do sum eksportowanych przez /metrics. Błąd Redis nie zmienia wyniku zadania."""
+    try:
+        publish_job_metrics(redis_conn, timer, status)
+    except RedisError as e:
+        print(f"Nie udało się zapisać metryk zadania {job_id}: {e}")
+
+class JobProgress:
+    """Postęp zadania: publikowany w Redis co PROGRESS_INTERVAL sekund, a do bazy zapisywany co PROGRESS_DB_INTERVAL sekund."""
+    def __init__(self, job, publisher, total_frames):
+        self.job = job
+        self.publisher = publisher
+        self.total_frames = total_frames
+        self.last_progress_time = self.last_db_time = time.monotonic()
+
+    def update(self, frame_number):
+        now = time.monotonic()
+        if now - self.last_progress_time < PROGRESS_INTERVAL: return
+        job = self.job
+        progress = min(int((frame_number / self.total_frames) * 100), 99) if self.total_frames > 0 else job.progress
+        self.publisher.publish(job.status, progress, frame_number)
+        self.last_progress_time = now
+        if now - self.last_db_time >= PROGRESS_DB_INTERVAL:
+            job.frames_processed, job.progress = frame_number, progress
+            db.session.commit()
+            self.last_db_time = now
+
+def _complete_job(job, writer, stats, timer, publisher, loop_start):
+    """Zamyka zapis wyników, zapisuje metryki, obszary polowania i wizualizację, oznacza zadanie jako zakończone."""
+    writer.close()
+    stats['frames_per_s'] = writer.rows_written / max(time.perf_counter() - loop_start, 1e-9)
+    hunt_areas = writer.hunt_areas.areas()
+    job.hunt_areas_json = json.dumps(hunt_areas)
+    # Wizualizacja powstaje w workerze, żeby strona wyników nigdy nie czekała na rysowanie
+    try:
+        with timer.stage('visualization'):
+            _store_visualization(job, writer.path_coords(), hunt_areas)
+    except Exception as e:
+        print(f"Nie udało się narysować wizualizacji zadania {job.id}: {e}")
+    # Czas całego przebiegu - tyle oszczędza każde ponowne użycie wyników z cache
+    stats['job_s'] = stats.get('ingest_s', 0.0) + time.perf_counter() - loop_start
+    job.metrics_json = json.dumps({**stats, **timer.summary()})
+
+    job.progress = 100
+    job.frames_processed = writer.columns['frame_number'][-1] if len(writer.columns['frame_number']) else 0
+    job.status = 'completed'
+    db.session.commit()
+    publisher.publish(job.status, job.progress, job.frames_processed)
+    _publish_job_metrics(job.id, timer, 'completed')
+    try:
+        _evict_result_cache()
+    except OSError as e:
+        print(f"Nie udało się ograniczyć rozmiaru cache wyników: {e}")
+
+def _fail_job(job, error, timer, publisher):
+    db.session.rollback()
+    job.status = f'failed: {str(error)}'
+    db.session.commit()
+    publisher.publish(job.status, job.progress, job.frames_processed)
+    _publish_job_metrics(job.id, timer, 'failed')
+    print(f"Błąd w zadaniu {job.id}: {error}")
+
+def _interrupt_job(job, error, timer, publisher):
+    """Przebieg przerwany (np. po przekroczeniu limitu czasu), który RQ ponowi - zadanie wraca do kolejki
+    i wznowi analizę od punktu kontrolnego."""
+    db.session.rollback()
+    job.status = 'queued'
+    db.session.commit()
+    publisher.publish(job.status, job.progress, job.frames_processed)
+    _publish_job_metrics(job.id, timer, 'interrupted')
+    print(f"Zadanie {job.id} przerwane ({error}) - zostanie wznowione od klatki {(job.last_frame or -1) + 1}")
+
+def run_analysis(job_id, source_type, source_data, frame_skip, upload_path=None, sample_fps=None):
+    """Główna funkcja analityczna, uruchamiana przez workera RQ. Ponowiony przebieg wznawia analizę od Job.last_frame."""
+    job_start = time.perf_counter()
+    queue_name, queue_wait = current_queue_wait()
+    _publish_job_timing('queue_wait', queue_name, queue_wait)
+    with app.app_context():
+        job = Job.query.get(job_id)
+        if not job: return
+        publisher = ProgressPublisher(redis_conn, job_id, job.user_id)
+        # To samo nagranie mogło zostać przeanalizowane, gdy zadanie czekało w kolejce
+        cached = find_cached_result(job.cache_key) if job.last_frame is None else None
+        if cached:
+            complete_from_cache(job, cached)
+            return publisher.publish(job.status, job.progress, job.frames_processed)
 
         job.status = 'processing'
         db.session.commit()
+        publisher.publish(job.status, job.progress, job.frames_processed)
+        timer = StageTimer()
+        profiler = cProfile.Profile() if PROFILE_JOBS else None
+        if profiler: profiler.enable()
         
         try:
             video_path = upload_path
-            if source_type != 'upload':
+            streaming = STREAMING_INGEST and source_type != 'upload'
+            expected_frames = 0
+            if streaming:
+                with timer.stage('download'):
+                    video_path, expected_frames = resolve_stream(source_type, source_data)
+            elif source_type != 'upload':
                 video_filename = f"{job_id}.mp4"
-                video_path = os.path.join('app', 'uploads', video_filename)
-                download_video(source_type, source_data, video_path)
+                video_path = os.path.join(UPLOAD_FOLDER, video_filename)
+                with timer.stage('download'):
+                    download_video(source_type, source_data, video_path)
 
-            analyzer = TibiaFrameAnalyzer('map.png')
             cap = cv2.VideoCapture(video_path)
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            frame_number = 0
-
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret: break
-
-                if frame_number % (frame_skip + 1) == 0:
-                    analysis_result = analyzer.analyze_frame(frame)
-                    
-                    # Zapis wyników do bazy danych
-                    frame_data = FrameData(
-                        job_id=job_id,
-                        frame_number=frame_number,
-                        timestamp=cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0,
-                        player_coords_json=json.dumps(analysis_result['player_coords']),
-                        stats_json=json.dumps(analysis_result['stats']),
-                        battle_list_json=json.dumps(analysis_result['battle_list'])
-                    )
-                    db.session.add(frame_data)
-                
-                if frame_number % 50 == 0: # Zapisuj postęp co 50 klatek
-                    job.progress = int((frame_number / total_frames) * 100)
-                    db.session.commit()
-
-                frame_number += 1
-            
-            job.progress = 100
-            job.status = 'completed'
-            db.session.commit()
+            if not cap.isOpened(): raise IOError("Nie można otworzyć wideo")
+            # Dla strumieni liczba klatek bywa nieznana (0 lub wartość ujemna) - wtedy raportujemy tylko licznik klatek
+            total_frames = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0) or expected_frames
+            cap.release()
+
+            stats = {'ingest_s': time.perf_counter() - job_start}
+            if queue_wait is not None: stats['queue_wait_s'] = queue_wait
+            # Wyniki trafiają do bazy paczkami, niezależnie od aktualizacji postępu; każda paczka zapisuje punkt kontrolny
+            writer = FrameDataWriter(db.session, FrameData, BattleListEntry, artifact=artifact_path(job_id), timer=timer, on_flush=_checkpoint(job))
+            start_frame = _resume_results(job, writer)
+            if ANALYSIS_WORKERS > 1 and not streaming and total_frames >= 2 * SEGMENT_MIN_FRAMES:
+                results = iter_segmented_results(video_path, frame_skip, ANALYSIS_WORKERS, sample_fps=sample_fps, stats=stats, timer=timer, start_frame=start_frame)
+            else:
+                results = iter_sequential_results(video_path, frame_skip, TibiaFrameAnalyzer(timer=timer), start_frame, sample_fps=sample_fps, seekable=not streaming, stats=stats)
+
+            progress = JobProgress(job, publisher, total_frames)
+            loop_start = time.perf_counter()
+            for frame_number, timestamp, analysis_result in results:
+                # Opóźnienie startu zadania: od rozpoczęcia run_analysis do pierwszej przeanalizowanej klatki
+                if 'first_frame_s' not in stats: stats['first_frame_s'] = time.perf_counter() - job_start
+                writer.add(job_id, frame_number, timestamp, analysis_result)
+                progress.update(frame_number)
+            _complete_job(job, writer, stats, timer, publisher, loop_start)
 
         except Exception as e:
-            job.status = f'failed: {str(e)}'
-            db.session.commit()
-            print(f"Błąd w zadaniu {job_id}: {e}")
+            if will_retry(e):
+                _interrupt_job(job, e, timer, publisher)
+                raise
+            _fail_job(job, e, timer, publisher)
         finally:
-            if source_type != 'upload' and video_path and os.path.exists(video_path):
+            _publish_job_timing('duration', queue_name, time.perf_counter() - job_start)
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(RESULTS_FOLDER, f"{job_id}.prof"))
+            if source_type != 'upload' and not streaming and video_path and os.path.exists(video_path):
                 os.remove(video_path)
+
+class BatchClip:
+    """Jedno nagranie w analizie wsadowej: własne zadanie Job, analizator (stan śledzenia), dekoder, zapis wyników i postęp."""
+    def __init__(self, job, resources):
+        self.job = job
+        self.timer = StageTimer()
+        self.analyzer = TibiaFrameAnalyzer(resources=resources, timer=self.timer)
+        self.publisher = ProgressPublisher(redis_conn, job.id, job.user_id)
+        self.cap = None
+
+    def open(self, video_path, frame_skip, sample_fps):
+        self.job.status = 'processing'
+        db.session.commit()
+        self.publisher.publish(self.job.status, self.job.progress, self.job.frames_processed)
+        self.cap = cv2.VideoCapture(video_path)
+        if not self.cap.isOpened(): raise IOError("Nie można otworzyć wideo")
+        self.writer = FrameDataWriter(db.session, FrameData, BattleListEntry, artifact=artifact_path(self.job.id), timer=self.timer, on_flush=_checkpoint(self.job))
+        start_frame = _resume_results(self.job, self.writer)
+        self.sampler = FrameSampler(self.cap, sampling_step(frame_skip, sample_fps, self.cap.get(cv2.CAP_PROP_FPS)), start_frame, timer=self.timer)
+        self.frames = iter(self.sampler)
+        self.progress = JobProgress(self.job, self.publisher, max(int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0))
+        self.start = time.perf_counter()
+
+    def add(self, frame_number, timestamp, analysis_result):
+        self.writer.add(self.job.id, frame_number, timestamp, analysis_result)
+        self.progress.update(frame_number)
+
+    def complete(self, batch_clips):
+        self.close()
+        stats = {**self.sampler.stats(), **self.analyzer.pop_metrics(), 'batch_clips': batch_clips}
+        _complete_job(self.job, self.writer, stats, self.timer, self.publisher, self.start)
+
+    def fail(self, error):
+        self.close()
+        _fail_job(self.job, error, self.timer, self.publisher)
+
+    def interrupt(self, error):
+        self.close()
+        _interrupt_job(self.job, error, self.timer, self.publisher)
+
+    def close(self):
+        if self.cap is not None: self.cap.release()
+
+@contextmanager
+def _clip_errors(clips, clip):
+    """Błąd jednego nagrania paczki kończy niepowodzeniem tylko jego zadanie i usuwa je z otwartych nagrań.
+    Przekroczenie limitu czasu dotyczy całego zadania RQ, więc przechodzi dalej."""
+    try:
+        yield
+    except JobTimeoutException:
+        raise
+    except Exception as e:
+        if clip in clips: clips.remove(clip)
+        clip.fail(e)
+
+def _analyze_shares(batch, clips, shares):
+    """Wyniki analizy paczki dla każdego nagrania (lista w kolejności shares, None dla nagrań zakończonych błędem).
+    Jeśli analiza całej paczki się nie powiedzie, każde nagranie jest analizowane osobno, żeby błąd dotknął tylko
+    nagrania, które go powoduje."""
+    items = [(clip.analyzer, regions) for clip, rows in shares for _, _, regions in rows]
+    try:
+        results = batch.analyze(items) if items else []
+    except JobTimeoutException:
+        raise
+    except Exception:
+        per_clip = [None] * len(shares)
+        for i, (clip, rows) in enumerate(shares):
+            with _clip_errors(clips, clip):
+                per_clip[i] = batch.analyze([(clip.analyzer, regions) for _, _, regions in rows]) if rows else []
+        return per_clip
+    bounds = np.cumsum([0] + [len(rows) for _, rows in shares])
+    return [results[start:end] for start, end in zip(bounds, bounds[1:])]
+
+def run_batch_analysis(job_ids, upload_paths, frame_skip, sample_fps=None):
+    """Zadanie RQ dla wielu nagrań przesłanych naraz. Jeden proces analizuje jednocześnie do BATCH_LANES nagrań:
+    klatki wszystkich otwartych nagrań trafiają do wspólnych paczek BatchFrameAnalyzer (wektorowe paski i battle listy,
+    wspólny cache OCR), a każde nagranie ma własne zadanie Job, wyniki i postęp.
+    Błąd jednego nagrania (dekodowanie, analiza, zapis) kończy tylko jego zadanie; przekroczenie limitu czasu
+    przerywa wszystkie otwarte nagrania. Ponowiony przebieg pomija zakończone nagrania, a przerwane wznawia
+    od ich punktów kontrolnych."""
+    job_start = time.perf_counter()
+    queue_name, queue_wait = current_queue_wait()
+    _publish_job_timing('queue_wait', queue_name, queue_wait)
+    with app.app_context():
+        jobs = {job.id: job for job in Job.query.filter(Job.id.in_(job_ids))}
+        pending = [(jobs[job_id], path) for job_id, path in zip(job_ids, upload_paths) if job_id in jobs and jobs[job_id].status != 'completed']
+        resources = get_shared_resources()
+        batch = BatchFrameAnalyzer(NameRecognizer(resources.ocr_reader))
+        # Klatki na nagranie w jednej paczce - paczka zawiera ok. BATCH_FRAMES klatek ze wszystkich otwartych nagrań
+        per_clip = max(BATCH_FRAMES // BATCH_LANES, 1)
+        clips = []
+        try:
+            while pending or clips:
+                while pending and len(clips) < BATCH_LANES:
+                    job, video_path = pending.pop(0)
+                    clip = BatchClip(job, resources)
+                    clips.append(clip)
+                    with _clip_errors(clips, clip):
+                        clip.open(video_path, frame_skip, sample_fps)
+                shares = []
+                for clip in list(clips):
+                    with _clip_errors(clips, clip):
+                        # Klatka jest od razu przycinana do fragmentów interfejsu - paczka nie trzyma pełnych klatek
+                        shares.append((clip, [(frame_number, timestamp, batch.crop(clip.analyzer, frame))
+                                              for frame_number, timestamp, frame in itertools.islice(clip.frames, per_clip)]))
+                for (clip, rows), results in zip(shares, _analyze_shares(batch, clips, shares)):
+                    if results is None: continue
+                    with _clip_errors(clips, clip):
+                        for (frame_number, timestamp, _), analysis_result in zip(rows, results):
+                            clip.add(frame_number, timestamp, analysis_result)
+                        if len(rows) < per_clip:
+                            clip.complete(len(job_ids))
+                            clips.remove(clip)
+        except Exception as e:
+            retry = will_retry(e)
+            for clip in clips:
+                if retry: clip.interrupt(e)
+                else: clip.fail(e)
+            if retry: raise
+            for job, _ in pending: BatchClip(job, resources).fail(e)
+        finally:
+            for clip in clips: clip.close()
+            _publish_job_metrics('batch', batch.timer, None)
+            _publish_job_timing('duration', queue_name, time.perf_counter() - job_start)
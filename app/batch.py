@@ -0,0 +1,111 @@
+# app/batch.py
+# Analiza wsadowa: klatki wielu nagrań (np. krótkich klipów przesłanych naraz) analizowane paczkami w jednym procesie.
+# Stałe fragmenty interfejsu (paski HP/many, wiersze battle listy) są składane w tablice NumPy i liczone jedną
+# konwersją HSV na całą paczkę, a do rozpoznawania nazw trafiają tylko niepuste wiersze (przez cache NameRecognizer).
+# Śledzenie pozycji pozostaje sekwencyjne w obrębie nagrania - jego stan trzyma TibiaFrameAnalyzer danego nagrania.
+
+import cv2
+import numpy as np
+
+from app.metrics import StageTimer
+from app.resources import UI_TEMPLATES
+
+# Geometria i progi odczytu interfejsu (wspólne z TibiaFrameAnalyzer)
+ENTRY_HEIGHT = 22
+BATTLE_LIST_SIZE = (300, 150)  # (wysokość, szerokość) battle listy
+EMPTY_ROW_MEAN = 25
+TARGET_MARKER_MEAN = 100
+HP_BAR_HSV = (np.array([0, 120, 70]), np.array([10, 255, 255]))
+MANA_BAR_HSV = (np.array([100, 150, 0]), np.array([140, 255, 255]))
+CREATURE_HP_HSV = (np.array([30, 100, 100]), np.array([90, 255, 255]))
+
+
+def status_bar_regions(frame):
+    """Fragment klatki z paskami HP (górne 10 wierszy) i many (dolne 10 wierszy)."""
+    h = frame.shape[0]
+    return frame[h-30:h-10, 10:110]
+
+
+def hsv_fill(rois, hsv_range):
+    """Procent pikseli w zakresie HSV dla stosu jednakowych fragmentów (N, h, w, 3) - jedna konwersja na cały stos."""
+    n, h, w, _ = rois.shape
+    if not n: return np.zeros(0)
+    mask = cv2.inRange(cv2.cvtColor(np.ascontiguousarray(rois).reshape(n * h, w, 3), cv2.COLOR_BGR2HSV), *hsv_range)
+    return np.count_nonzero(mask.reshape(n, h * w), axis=1) * (100.0 / (h * w))
+
+
+def stack_gray(rois):
+    """Konwersja listy fragmentów BGR do skali szarości; jednakowe fragmenty jedną konwersją."""
+    if not rois: return []
+    if len({roi.shape for roi in rois}) > 1: return [cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY) for roi in rois]
+    h, w, _ = rois[0].shape
+    return list(cv2.cvtColor(np.concatenate(rois), cv2.COLOR_BGR2GRAY).reshape(len(rois), h, w))
+
+
+class BatchFrameAnalyzer:
+    """Analiza paczek klatek z wielu nagrań. Każda klatka jest tuż po dekodowaniu przycinana do fragmentów interfejsu
+    (crop), więc paczka nie trzyma pełnych klatek. analyze() zwraca wyniki w formacie TibiaFrameAnalyzer.analyze_frame.
+    Wspólny NameRecognizer sprawia, że nazwy rozpoznane w jednym nagraniu są trafieniami cache w pozostałych."""
+    def __init__(self, name_recognizer, timer=None):
+        self.name_recognizer = name_recognizer
+        self.timer = timer or StageTimer()
+
+    def crop(self, analyzer, frame):
+        """Fragmenty klatki potrzebne do analizy: (minimapa lub None, battle lista (300, 150, 3) lub None, paski)."""
+        minimap_pos = analyzer._find_ui_element(frame, UI_TEMPLATES['minimap'], 'minimap')
+        battle_pos = analyzer._find_ui_element(frame, UI_TEMPLATES['battle_list'], 'battle_list')
+        minimap = None
+        if minimap_pos:
+            x, y, w, h = minimap_pos
+            minimap = frame[y:y+h, x:x+w].copy()
+        battle_list = None
+        if battle_pos:
+            x, y, w, h = battle_pos
+            roi = frame[y:y+h, x:x+w]
+            # Battle lista przy krawędzi klatki jest uzupełniana czernią - takie wiersze są traktowane jako puste
+            battle_list = np.zeros(BATTLE_LIST_SIZE + (3,), np.uint8)
+            battle_list[:roi.shape[0], :roi.shape[1]] = roi[:BATTLE_LIST_SIZE[0], :BATTLE_LIST_SIZE[1]]
+        return minimap, battle_list, status_bar_regions(frame).copy()
+
+    def _status_bars(self, bars):
+        bars = np.stack(bars)
+        hp, mana = hsv_fill(bars[:, :10], HP_BAR_HSV), hsv_fill(bars[:, 10:], MANA_BAR_HSV)
+        return [{"hp": round(float(h), 2), "mana": round(float(m), 2)} for h, m in zip(hp, mana)]
+
+    def _battle_lists(self, rois):
+        """Wiersze battle list całej paczki: puste wiersze, paski HP i znaczniki celu liczone wektorowo dla każdej klatki.
+        Nazwy wszystkich niepustych wierszy przechodzą przez NameRecognizer - wiersze o znanym hashu paska z nazwą
+        są trafieniami cache, a pozostałe rozpoznaje jedno wywołanie recognizera na paczkę."""
+        if not rois: return []
+        count, rows_per_list, width = len(rois), BATTLE_LIST_SIZE[0] // ENTRY_HEIGHT, BATTLE_LIST_SIZE[1]
+        rows = np.stack(rois)[:, :rows_per_list * ENTRY_HEIGHT].reshape(count, rows_per_list, ENTRY_HEIGHT, width, 3)
+        occupied = rows.reshape(count, rows_per_list, -1).mean(axis=2) >= EMPTY_ROW_MEAN
+        entries = rows[occupied]
+        if not len(entries): return [[] for _ in rois]
+        hp = hsv_fill(entries[:, 12:15, 5:width-5], CREATURE_HP_HSV)
+        targets = entries[:, :, 0:3].reshape(len(entries), -1).mean(axis=1) > TARGET_MARKER_MEAN
+        with self.timer.stage('battle_list_ocr'):
+            names = self.name_recognizer.read_names(stack_gray([np.ascontiguousarray(entry[:, 5:]) for entry in entries]))
+        starts = np.concatenate(([0], np.cumsum(np.count_nonzero(occupied, axis=1))))
+        return [[{"name": names[j], "hp_percent": round(float(hp[j]), 2), "is_target": bool(targets[j])}
+                 for j in range(starts[i], starts[i + 1]) if names[j]] for i in range(count)]
+
+    def analyze(self, items):
+        """items: lista (analizator nagrania, wynik crop) w kolejności klatek każdego nagrania. Zwraca listę wyników."""
+        timer = self.timer
+        with timer.stage('batch_status_bars'):
+            stats = self._status_bars([regions[2] for _, regions in items])
+        with timer.stage('batch_battle_list'):
+            with_list = [i for i, (_, regions) in enumerate(items) if regions[1] is not None]
+            battle_lists = [[] for _ in items]
+            for i, battle_list in zip(with_list, self._battle_lists([items[i][1][1] for i in with_list])):
+                battle_lists[i] = battle_list
+        with timer.stage('batch_minimap'):
+            with_minimap = [i for i, (_, regions) in enumerate(items) if regions[0] is not None]
+            minimaps = [None] * len(items)
+            for i, gray in zip(with_minimap, stack_gray([items[i][1][0] for i in with_minimap])):
+                minimaps[i] = gray
+        results = []
+        for (analyzer, _), minimap_gray, frame_stats, battle_list in zip(items, minimaps, stats, battle_lists):
+            results.append(analyzer.analyze_regions(minimap_gray, frame_stats, battle_list))
+        return results
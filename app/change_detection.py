@@ -0,0 +1,46 @@
+# app/change_detection.py
+# Wykrywanie zmian we fragmentach interfejsu między kolejnymi analizowanymi klatkami.
+# Jeśli minimapa się nie zmieniła, analizator pomija śledzenie i zostawia poprzednią pozycję. Małe elementy
+# (paski HP, znaczniki celu) giną w miniaturze, dlatego paski i battle lista są odczytywane w każdej klatce.
+
+import os
+from collections import Counter
+import cv2
+
+# Średnia bezwzględna różnica pikseli (0-255) na miniaturze fragmentu, poniżej której uznajemy go za niezmieniony.
+# 0 wyłącza pomijanie.
+REGION_CHANGE_THRESHOLD = float(os.getenv('REGION_CHANGE_THRESHOLD', '1.5'))
+
+
+class RegionChangeDetector:
+    """Porównuje pomniejszone kopie fragmentów klatki z ich stanem z ostatniej pełnej analizy."""
+    def __init__(self, threshold=REGION_CHANGE_THRESHOLD, size=(32, 32)):
+        self.threshold = threshold
+        self.size = size
+        self.previous = {}
+        self.checked = Counter()
+        self.skipped = Counter()
+
+    def changed(self, name, roi):
+        """True, jeśli fragment trzeba przeanalizować ponownie. Miniatura jest zapamiętywana tylko przy zmianie,
+        więc powolne zmiany kumulują się, zamiast ginąć poniżej progu."""
+        self.checked[name] += 1
+        if self.threshold <= 0 or roi.size == 0: return True
+        thumbnail = cv2.resize(roi, self.size, interpolation=cv2.INTER_AREA)
+        previous = self.previous.get(name)
+        if previous is not None and previous.shape == thumbnail.shape \
+                and cv2.norm(thumbnail, previous, cv2.NORM_L1) / thumbnail.size < self.threshold:
+            self.skipped[name] += 1
+            return False
+        self.previous[name] = thumbnail
+        return True
+
+    def reset(self):
+        self.previous.clear()
+
+    def pop_metrics(self):
+        metrics = {'regions_checked': sum(self.checked.values()), 'regions_skipped': sum(self.skipped.values())}
+        metrics.update({f'regions_skipped_{name}': count for name, count in self.skipped.items()})
+        self.checked.clear()
+        self.skipped.clear()
+        return metrics
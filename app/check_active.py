@@ -3,10 +3,16 @@
 # Używany przez cron do bezpiecznego restartu aplikacji.
 # Zwraca kod wyjścia 0, jeśli można bezpiecznie zrestartować.
 # Zwraca kod wyjścia 1, jeśli zadanie jest w toku.
+# Zadania 'processing', których nie wykonuje żaden żyjący worker RQ (np. worker zabity w trakcie analizy),
+# nie wstrzymują restartu - po restarcie worker wznowi je od punktu kontrolnego.
 
+import os
 import sys
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from redis import Redis
+from redis.exceptions import RedisError
+from rq import Worker
 
 # Konfiguracja, aby skrypt mógł połączyć się z tą samą bazą danych co aplikacja
 app = Flask(__name__)
@@ -18,14 +24,26 @@ db = SQLAlchemy(app)
 class Job(db.Model):
     id = db.Column(db.String(36), primary_key=True)
     status = db.Column(db.String(50), default='queued')
+    rq_job_id = db.Column(db.String(64))
     # Reszta pól nie jest potrzebna do tego sprawdzenia
     __tablename__ = 'job' 
 
+def running_job_ids():
+    """Zadania RQ wykonywane przez żyjące workery lub None, jeśli Redis jest niedostępny."""
+    try:
+        workers = Worker.all(connection=Redis.from_url(os.getenv('REDIS_URL', 'redis://redis:6379')))
+    except RedisError:
+        return None
+    return {worker.get_current_job_id() for worker in workers}
+
 def check_for_active_jobs():
-    """Sprawdza bazę danych w poszukiwaniu zadań ze statusem 'processing'."""
+    """Sprawdza bazę danych w poszukiwaniu zadań ze statusem 'processing' wykonywanych przez workery."""
     with app.app_context():
         try:
-            processing_jobs_count = Job.query.filter_by(status='processing').count()
+            processing_jobs = Job.query.filter_by(status='processing').all()
+            running = running_job_ids()
+            # Bez Redis nie wiemy, które zadania są naprawdę w toku - liczymy wszystkie
+            processing_jobs_count = sum(1 for job in processing_jobs if running is None or job.rq_job_id is None or job.rq_job_id in running)
             if processing_jobs_count > 0:
                 print(f"Wykryto {processing_jobs_count} aktywnych zadan. Restart wstrzymany.")
                 return 1 # Zwróć błąd, jeśli są aktywne zadania
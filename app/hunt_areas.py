@@ -0,0 +1,115 @@
+# app/hunt_areas.py
+# Wyznaczanie obszarów polowania (hunt) z histogramu gęstości na siatce zamiast DBSCAN na wszystkich punktach.
+# Pozycje gracza są zliczane w komórkach HUNT_CELL_SIZE x HUNT_CELL_SIZE z wagą równą czasowi spędzonemu w klatce,
+# więc powtarzające się pozycje nie zwiększają kosztu, a histogram można uzupełniać przyrostowo w trakcie analizy.
+# Oprócz gęstości liczy się czas pobytu na jedno wejście do komórki - dzięki temu wielokrotnie przechodzona
+# trasa między huntami (gęsta, ale pokonywana szybko) nie skleja ich w jeden obszar.
+
+import os
+from array import array
+import cv2
+import numpy as np
+
+# Bok komórki siatki w pikselach mapy; sąsiedztwo 3x3 komórek odpowiada mniej więcej eps=50 z dawnego DBSCAN
+HUNT_CELL_SIZE = int(os.getenv('HUNT_CELL_SIZE', '16'))
+# Odpowiednik min_samples: tyle próbek w sąsiedztwie 3x3 komórek czyni komórkę rdzeniem obszaru
+HUNT_MIN_SAMPLES = int(os.getenv('HUNT_MIN_SAMPLES', '20'))
+# Minimalny średni czas (s) pobytu w sąsiedztwie komórki na jedno wejście - przejście trasą trwa krócej
+HUNT_MIN_DWELL = float(os.getenv('HUNT_MIN_DWELL', '10'))
+# Obszary z mniejszą łączną liczbą próbek są pomijane
+HUNT_MIN_AREA_SAMPLES = 50
+# Wyjście z obszaru na więcej niż tyle kolejnych komórek trasy liczy się jako zakończenie wizyty
+HUNT_VISIT_GAP = 3
+# Przerwy między klatkami dłuższe niż tyle sekund (np. zgubione fragmenty strumienia) nie są liczone jako czas w obszarze
+HUNT_MAX_GAP = 10.0
+# Klucz komórki: cy * _KEY_STRIDE + cx
+_KEY_STRIDE = 1 << 20
+
+
+def frame_durations(timestamps, last_timestamp=None):
+    """Czas przypisany każdej klatce: odstęp od poprzedniej przeanalizowanej klatki, obcięty do HUNT_MAX_GAP."""
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if not len(timestamps): return timestamps
+    previous = timestamps[0] if last_timestamp is None else last_timestamp
+    return np.clip(np.diff(timestamps, prepend=previous), 0.0, HUNT_MAX_GAP)
+
+
+class HuntAreaAccumulator:
+    """Przyrostowy histogram pozycji gracza na siatce. add() przyjmuje kolejne paczki pozycji,
+    areas() zwraca wszystkie obszary polowania z czasem, liczbą próbek i liczbą wizyt."""
+    def __init__(self, cell_size=HUNT_CELL_SIZE):
+        self.cell_size = cell_size
+        # Klucz komórki -> liczba próbek / czas w sekundach (oba słowniki mają tę samą kolejność kluczy)
+        self.samples = {}
+        self.seconds = {}
+        # Kolejne różne komórki na trasie gracza (kodowanie długości serii) - do liczenia wizyt
+        self.route = array('q')
+
+    def add(self, xs, ys, weights=None):
+        """Dodaje pozycje (w kolejności czasu); weights to czas w sekundach przypisany każdej pozycji (domyślnie 1 s)."""
+        xs, ys = np.atleast_1d(np.asarray(xs, dtype=np.int64)), np.atleast_1d(np.asarray(ys, dtype=np.int64))
+        if not len(xs): return
+        keys = (ys // self.cell_size) * _KEY_STRIDE + xs // self.cell_size
+        weights = np.ones(len(keys)) if weights is None else np.broadcast_to(np.asarray(weights, dtype=np.float64), keys.shape)
+        unique, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        seconds = np.bincount(inverse, weights=weights, minlength=len(unique))
+        for key, count, duration in zip(unique.tolist(), counts.tolist(), seconds.tolist()):
+            self.samples[key] = self.samples.get(key, 0) + count
+            self.seconds[key] = self.seconds.get(key, 0.0) + duration
+        changes = keys[np.r_[True, keys[1:] != keys[:-1]]]
+        if self.route and changes[0] == self.route[-1]: changes = changes[1:]
+        self.route.frombytes(changes.tobytes())
+
+    def areas(self, min_samples=HUNT_MIN_SAMPLES, min_dwell=HUNT_MIN_DWELL, min_area_samples=HUNT_MIN_AREA_SAMPLES):
+        """Lista obszarów posortowana malejąco po czasie (a potem po liczbie próbek). Prostokąty w pikselach mapy."""
+        if not self.samples: return []
+        keys = np.fromiter(self.samples.keys(), np.int64, len(self.samples))
+        counts = np.fromiter(self.samples.values(), np.float64, len(self.samples))
+        seconds = np.fromiter(self.seconds.values(), np.float64, len(self.seconds))
+        cx, cy = keys % _KEY_STRIDE, keys // _KEY_STRIDE
+        col, row = cx - cx.min(), cy - cy.min()
+        # Indeks komórki dla każdego kroku trasy i liczba wejść do każdej komórki
+        order = np.argsort(keys)
+        route = order[np.searchsorted(keys[order], np.frombuffer(self.route, dtype=np.int64))]
+        entries = np.bincount(route, minlength=len(keys))
+        grid, grid_seconds, grid_entries = (np.zeros((row.max() + 1, col.max() + 1), np.float32) for _ in range(3))
+        grid[row, col], grid_seconds[row, col], grid_entries[row, col] = counts, seconds, entries
+
+        # Rdzenie: komórki z próbkami, odpowiednią gęstością i czasem pobytu w sąsiedztwie; spójne grupy rdzeni to obszary
+        box = lambda g: cv2.boxFilter(g, -1, (3, 3), normalize=False, borderType=cv2.BORDER_CONSTANT)
+        dwell = box(grid_seconds) / np.maximum(box(grid_entries), 1)
+        core = ((grid > 0) & (box(grid) >= min_samples) & (dwell >= min_dwell)).astype(np.uint8)
+        n, labels = cv2.connectedComponents(core, connectivity=8)
+        if n < 2: return []
+        # Komórki brzegowe (jak punkty brzegowe w DBSCAN) dołączają do sąsiedniego obszaru
+        member = cv2.dilate(labels.astype(np.float32), np.ones((3, 3), np.uint8)).astype(np.int32)
+        member[core == 1] = labels[core == 1]
+        cell_label = member[row, col]
+
+        samples = np.bincount(cell_label, weights=counts, minlength=n)
+        time_spent = np.bincount(cell_label, weights=seconds, minlength=n)
+        x0, y0 = np.full(n, np.iinfo(np.int64).max), np.full(n, np.iinfo(np.int64).max)
+        x1, y1 = np.full(n, -1), np.full(n, -1)
+        np.minimum.at(x0, cell_label, cx); np.minimum.at(y0, cell_label, cy)
+        np.maximum.at(x1, cell_label, cx); np.maximum.at(y1, cell_label, cy)
+
+        # Wizyty: wejścia na obszar na trasie, z pominięciem krótkich wyjść poza jego brzeg
+        route_labels = cell_label[route]
+        steps = np.flatnonzero(route_labels)
+        visited = route_labels[steps]
+        new_visit = np.r_[True, (visited[1:] != visited[:-1]) | (np.diff(steps) > HUNT_VISIT_GAP)] if len(steps) else np.zeros(0, bool)
+        visits = np.bincount(visited[new_visit], minlength=n)
+
+        size = self.cell_size
+        found = [{'x': int(x0[k] * size), 'y': int(y0[k] * size), 'w': int((x1[k] - x0[k] + 1) * size), 'h': int((y1[k] - y0[k] + 1) * size),
+                  'samples': int(samples[k]), 'seconds': round(float(time_spent[k]), 2), 'visits': int(visits[k])}
+                 for k in range(1, n) if samples[k] >= min_area_samples]
+        return sorted(found, key=lambda area: (area['seconds'], area['samples']), reverse=True)
+
+
+def find_hunt_areas(coords, timestamps=None, cell_size=HUNT_CELL_SIZE):
+    """Obszary polowania dla całej ścieżki (N, 2); bez timestamps (N,) każda próbka liczy się jako 1 s."""
+    coords = np.asarray(coords).reshape(-1, 2)
+    accumulator = HuntAreaAccumulator(cell_size)
+    accumulator.add(coords[:, 0], coords[:, 1], None if timestamps is None else frame_durations(timestamps))
+    return accumulator.areas()
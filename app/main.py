@@ -2,17 +2,27 @@
 # Główny plik aplikacji Flask, zintegrowany z bazą danych i kolejką zadań RQ.
 
 import os
+import io
+import csv
 import uuid
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, send_from_directory
+import json
+from datetime import datetime
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify, flash, send_from_directory, stream_with_context, abort
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
 from flask_sqlalchemy import SQLAlchemy
 from redis import Redis
+from redis.exceptions import RedisError
 from rq import Queue
-import json
+import numpy as np
 
 from app.auth import login_manager, users, user_objects
-from app.post_analysis import visualize_path_and_hunt_area
+from app.tiles import load_tiles_meta
+from app.storage import artifact_path, load_frame_artifact
+from app.progress import job_state, load_states, event_stream
+from app.metrics import render_prometheus, publish_cache_counters
+from app.result_cache import source_id, save_upload, cache_key, touch
+from app.scheduling import QUEUE_CLASSES, QUEUE_TIMEOUTS, probe_video, analysed_frames, choose_queue, enqueue_analysis
 
 # --- Konfiguracja Aplikacji ---
 app = Flask(__name__)
@@ -27,26 +37,142 @@ db = SQLAlchemy(app)
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
-# Połączenie z Redis i inicjalizacja kolejki
+# Połączenie z Redis i kolejki zadań (short/long/bulk - app.scheduling)
 redis_conn = Redis.from_url(os.getenv('REDIS_URL', 'redis://redis:6379'))
-q = Queue(connection=redis_conn)
+queues = {name: Queue(name, connection=redis_conn) for name in QUEUE_CLASSES}
+
+# Liczba zadań na jednej stronie panelu
+DASHBOARD_PAGE_SIZE = 20
+# Liczba punktów ścieżki przekazywanych do mapy kafelkowej na stronie wyników
+PATH_PREVIEW_POINTS = 2000
+# Eksport wyników: kolumny i liczba wierszy pobieranych z bazy jednym zapytaniem
+EXPORT_COLUMNS = ('frame_number', 'timestamp', 'x', 'y', 'z', 'hp', 'mana')
+EXPORT_CHUNK_SIZE = 5000
 
 # --- Modele Bazy Danych ---
 class Job(db.Model):
     id = db.Column(db.String(36), primary_key=True)
     status = db.Column(db.String(50), default='queued')
     progress = db.Column(db.Integer, default=0)
-    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    frames_processed = db.Column(db.Integer, default=0) # Przy strumieniach o nieznanej długości jedyna miara postępu
+    created_at = db.Column(db.DateTime, server_default=db.func.now(), index=True)
+    user_id = db.Column(db.String(80), index=True) # Właściciel zadania - na jego kanał trafiają zdarzenia postępu
+    metrics_json = db.Column(db.Text) # Statystyki przetwarzania (JSON), np. czas dekodowania i analizy
+    visualization = db.Column(db.String(64)) # Plik wizualizacji w OUTPUT_FOLDER; '' = brak danych do narysowania
+    hunt_areas_json = db.Column(db.Text) # Obszary polowania (JSON): prostokąt, czas, liczba próbek i wizyt
+    rq_job_id = db.Column(db.String(64)) # Zadanie RQ analizujące to nagranie (wspólne dla nagrań analizy wsadowej)
+    last_frame = db.Column(db.Integer) # Punkt kontrolny: ostatnia klatka, której wyniki są zapisane w bazie
+    cache_key = db.Column(db.String(64), index=True) # Źródło + parametry analizy + wersja analizatora (app.result_cache)
+    result_job_id = db.Column(db.String(36)) # Wyniki z cache: zadanie, którego wyniki (FrameData, artefakt) są pokazywane
     results = db.relationship('FrameData', backref='job', lazy=True, cascade="all, delete-orphan")
+    battle_entries = db.relationship('BattleListEntry', backref='job', lazy=True, cascade="all, delete-orphan")
 
 class FrameData(db.Model):
+    # Wszystkie odczyty wyników dotyczą jednego zadania w kolejności klatek
+    __table_args__ = (db.Index('ix_frame_data_job_id_frame_number', 'job_id', 'frame_number'),)
     id = db.Column(db.Integer, primary_key=True)
     job_id = db.Column(db.String(36), db.ForeignKey('job.id'), nullable=False)
     frame_number = db.Column(db.Integer, nullable=False)
     timestamp = db.Column(db.Float, nullable=False)
-    player_coords_json = db.Column(db.Text) # Przechowuje JSON
-    stats_json = db.Column(db.Text) # Przechowuje JSON
-    battle_list_json = db.Column(db.Text) # Przechowuje JSON
+    x = db.Column(db.Integer)
+    y = db.Column(db.Integer)
+    z = db.Column(db.Integer)
+    hp = db.Column(db.Float)
+    mana = db.Column(db.Float)
+    # Kolumny JSON ze starszych wersji - nowe zadania ich nie wypełniają, migracja: python -m app.migrate_results
+    player_coords_json = db.Column(db.Text)
+    stats_json = db.Column(db.Text)
+    battle_list_json = db.Column(db.Text)
+
+class BattleListEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(36), db.ForeignKey('job.id'), nullable=False, index=True)
+    frame_number = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(64), nullable=False)
+    hp_percent = db.Column(db.Float)
+    is_target = db.Column(db.Boolean, default=False)
+
+def load_path_coords(job_id, with_timestamps=False):
+    """Zwraca ścieżkę gracza jako tablicę (N, 2) - z artefaktu NPZ zadania, a w razie jego braku z kolumn x/y.
+    Z with_timestamps zwraca parę (ścieżka, znaczniki czasu klatek ścieżki)."""
+    columns = load_frame_artifact(artifact_path(job_id, app.config['OUTPUT_FOLDER']))
+    if columns is not None:
+        valid = (columns['x'] >= 0) & (columns['y'] >= 0)
+        coords, timestamps = np.column_stack((columns['x'][valid], columns['y'][valid])), columns['timestamp'][valid]
+    else:
+        rows = db.session.query(FrameData.x, FrameData.y, FrameData.timestamp).filter(FrameData.job_id == job_id, FrameData.x.isnot(None)).order_by(FrameData.frame_number).all()
+        rows = np.array(rows, dtype=np.float64).reshape(-1, 3)
+        coords, timestamps = rows[:, :2].astype(np.int32), rows[:, 2]
+    return (coords, timestamps) if with_timestamps else coords
+
+def load_path_points(job_id, max_points=PATH_PREVIEW_POINTS):
+    """Ścieżka gracza przerzedzona do około max_points punktów (mapa kafelkowa na stronie wyników).
+    Z artefaktu wczytuje tylko kolumny x/y, a bez artefaktu przerzedza wiersze już w zapytaniu SQL."""
+    path = artifact_path(job_id, app.config['OUTPUT_FOLDER'])
+    if os.path.exists(path):
+        with np.load(path) as data:
+            x, y = data['x'], data['y']
+        valid = (x >= 0) & (y >= 0)
+        coords = np.column_stack((x[valid], y[valid]))
+        return coords[::max(len(coords) // max_points, 1)]
+    positioned = db.session.query(db.func.count(FrameData.x)).filter(FrameData.job_id == job_id).scalar()
+    step = max(positioned // max_points, 1)
+    rows = db.session.query(FrameData.x, FrameData.y).filter(FrameData.job_id == job_id, FrameData.x.isnot(None), FrameData.id % step == 0) \
+        .order_by(FrameData.frame_number).all()
+    return np.array(rows, dtype=np.int32).reshape(-1, 2)
+
+def frame_summary(job_id):
+    """Agregaty wyników zadania liczone w SQL, bez wczytywania wierszy do pamięci."""
+    frames, positioned, hp_avg, hp_min, mana_avg = db.session.query(
+        db.func.count(FrameData.id), db.func.count(FrameData.x), db.func.avg(FrameData.hp), db.func.min(FrameData.hp), db.func.avg(FrameData.mana)
+    ).filter(FrameData.job_id == job_id).one()
+    battle_entries, creature_names = db.session.query(
+        db.func.count(BattleListEntry.id), db.func.count(db.distinct(BattleListEntry.name))
+    ).filter(BattleListEntry.job_id == job_id).one()
+    return {'frames': frames, 'positioned': positioned, 'hp_avg': hp_avg, 'hp_min': hp_min, 'mana_avg': mana_avg,
+            'battle_entries': battle_entries, 'creature_names': creature_names}
+
+def iter_frame_rows(job_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """Wiersze wyników zadania (kolumny EXPORT_COLUMNS) paczkami po chunk_size, stronicowane kluczem frame_number."""
+    table = FrameData.__table__
+    columns = [table.c[name] for name in EXPORT_COLUMNS]
+    last_frame = -1
+    while True:
+        rows = db.session.execute(db.select(*columns).where(table.c.job_id == job_id, table.c.frame_number > last_frame)
+                                  .order_by(table.c.frame_number).limit(chunk_size)).all()
+        if not rows: return
+        yield rows
+        last_frame = rows[-1].frame_number
+
+def result_job(job):
+    """Zadanie, z którego pochodzą wyniki (klatki, battle lista, wizualizacja) - dla trafień cache jest to oryginalna analiza."""
+    return (Job.query.get(job.result_job_id) if job.result_job_id else None) or job
+
+def publish_cache_stats(**counters):
+    try:
+        publish_cache_counters(redis_conn, **counters)
+    except RedisError as e:
+        print(f"Nie udało się zapisać statystyk cache wyników: {e}")
+
+def find_cached_result(key):
+    """Zakończona oryginalna analiza (nie kopia z cache) o tym samym kluczu cache lub None."""
+    if key is None: return None
+    return Job.query.filter(Job.cache_key == key, Job.status == 'completed', Job.result_job_id.is_(None)).order_by(Job.created_at.desc()).first()
+
+def complete_from_cache(job, source):
+    """Kończy zadanie wynikami wcześniejszej analizy tego samego nagrania - bez pobierania i analizy.
+    Zaoszczędzony czas to czas trwania oryginalnej analizy."""
+    metrics = json.loads(source.metrics_json) if source.metrics_json else {}
+    saved = metrics.get('job_s', 0.0)
+    job.result_job_id = source.id
+    job.status, job.progress, job.frames_processed = 'completed', 100, source.frames_processed
+    job.visualization, job.hunt_areas_json = source.visualization, source.hunt_areas_json
+    job.metrics_json = json.dumps({**metrics, 'cache_source_job': source.id, 'cache_saved_s': saved})
+    db.session.commit()
+    # Nagranie i artefakt oryginalnej analizy są znów w użyciu - eksmisja usunie je najpóźniej
+    touch([artifact_path(source.id, app.config['OUTPUT_FOLDER'])] +
+          [os.path.join(app.config['UPLOAD_FOLDER'], name) for name in os.listdir(app.config['UPLOAD_FOLDER']) if name.startswith(source.id + '_')])
+    publish_cache_stats(hits=1, saved_s=saved)
 
 # --- Routing ---
 @app.before_first_request
@@ -83,8 +209,23 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    jobs = Job.query.order_by(Job.created_at.desc()).all()
-    return render_template('dashboard.html', jobs=jobs)
+    # Stronicowanie kluczem (created_at, id) zamiast OFFSET: ?before=<created_at>|<id> ostatniego zadania poprzedniej strony
+    query = Job.query.order_by(Job.created_at.desc(), Job.id.desc())
+    cursor = request.args.get('before')
+    if cursor:
+        try:
+            created_at, job_id = cursor.split('|', 1)
+            # created_at (server_default) jest w SQLite tekstem bez mikrosekund - porównujemy z tekstem w tym samym formacie
+            created_at = db.type_coerce(datetime.fromisoformat(created_at).strftime('%Y-%m-%d %H:%M:%S'), db.String)
+        except ValueError:
+            abort(400)
+        query = query.filter(db.or_(Job.created_at < created_at, db.and_(Job.created_at == created_at, Job.id < job_id)))
+    jobs = query.limit(DASHBOARD_PAGE_SIZE + 1).all()
+    next_cursor = None
+    if len(jobs) > DASHBOARD_PAGE_SIZE:
+        jobs = jobs[:DASHBOARD_PAGE_SIZE]
+        next_cursor = f"{jobs[-1].created_at.isoformat()}|{jobs[-1].id}"
+    return render_template('dashboard.html', jobs=jobs, next_cursor=next_cursor, first_page=not cursor)
 
 @app.route('/start_analysis', methods=['POST'])
 @login_required
@@ -95,36 +236,104 @@ def start_analysis_route():
     source_type = request.form.get('source_type')
     source_data = request.form.get('source_data')
     frame_skip = int(request.form.get('frame_skip', 0))
+    # Opcjonalne próbkowanie czasowe: N analizowanych klatek na sekundę nagrania (zastępuje frame_skip)
+    sample_fps = float(request.form.get('sample_fps') or 0) or None
     job_id = str(uuid.uuid4())
     upload_path = None
+    source = source_id(source_type, source_data)
 
     if source_type == 'upload':
-        file = request.files.get('source_file')
-        if not file or file.filename == '':
+        files = [file for file in request.files.getlist('source_file') if file.filename]
+        if not files:
             return jsonify({'error': 'Nie wybrano pliku'}), 400
+        if len(files) > 1:
+            return start_batch_analysis(files, frame_skip, sample_fps)
+        file = files[0]
         filename = secure_filename(f"{job_id}_{file.filename}")
         upload_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(upload_path)
+        source = save_upload(file, upload_path)
         source_data = filename
     
     # Utwórz wpis w bazie danych dla nowego zadania
-    new_job = Job(id=job_id)
+    key = cache_key(source, frame_skip, sample_fps)
+    new_job = Job(id=job_id, user_id=current_user.id, rq_job_id=job_id, cache_key=key)
     db.session.add(new_job)
     db.session.commit()
 
-    # Dodaj zadanie do kolejki RQ
-    q.enqueue(run_analysis, job_id, source_type, source_data, frame_skip, upload_path, job_timeout=3600)
+    # To samo nagranie z tymi samymi parametrami było już analizowane - wyniki są gotowe od razu
+    cached = find_cached_result(key)
+    if cached:
+        complete_from_cache(new_job, cached)
+        if upload_path: os.remove(upload_path)
+        return jsonify({'job_id': job_id, 'cached': True})
+    if key: publish_cache_stats(misses=1)
+
+    # Kolejka według przewidywanej liczby analizowanych klatek. Długość nagrania z URL/YouTube nie jest znana
+    # bez odpytywania źródła, więc takie zadania trafiają do kolejki long.
+    frames = analysed_frames(*probe_video(upload_path), frame_skip, sample_fps) if upload_path else None
+    enqueue_analysis(redis_conn, choose_queue(frames), run_analysis, job_id, source_type, source_data, frame_skip, upload_path, sample_fps, job_id=job_id)
     
     return jsonify({'job_id': job_id})
 
+def start_batch_analysis(files, frame_skip, sample_fps):
+    """Wiele plików przesłanych naraz: osobne zadanie Job (i wyniki) dla każdego pliku, ale jedno zadanie RQ,
+    które analizuje je razem w jednym procesie (app.batch)."""
+    all_job_ids, job_ids, upload_paths = [], [], []
+    rq_job_id = f"batch-{uuid.uuid4()}"
+    for file in files:
+        job_id = str(uuid.uuid4())
+        upload_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(f"{job_id}_{file.filename}"))
+        key = cache_key(save_upload(file, upload_path), frame_skip, sample_fps)
+        job = Job(id=job_id, user_id=current_user.id, cache_key=key)
+        db.session.add(job)
+        all_job_ids.append(job_id)
+        # Pliki analizowane już wcześniej nie trafiają do paczki
+        cached = find_cached_result(key)
+        if cached:
+            complete_from_cache(job, cached)
+            os.remove(upload_path)
+            continue
+        if key: publish_cache_stats(misses=1)
+        job.rq_job_id = rq_job_id
+        job_ids.append(job_id)
+        upload_paths.append(upload_path)
+    db.session.commit()
+    if job_ids:
+        enqueue_analysis(redis_conn, 'bulk', 'app.analysis.run_batch_analysis', job_ids, upload_paths, frame_skip, sample_fps,
+                         job_id=rq_job_id, timeout=QUEUE_TIMEOUTS['bulk'] * len(job_ids))
+    return jsonify({'job_id': all_job_ids[0], 'job_ids': all_job_ids})
+
 @app.route('/status/<job_id>')
 @login_required
 def status_route(job_id):
+    # Worker zapisuje postęp do bazy rzadko - aktualny stan jest w Redis
+    state = load_states(redis_conn, [job_id]).get(job_id)
+    if state:
+        return jsonify({key: state[key] for key in ('status', 'progress', 'frames_processed')})
     job = Job.query.get(job_id)
     if job:
-        return jsonify({'status': job.status, 'progress': job.progress})
+        return jsonify({'status': job.status, 'progress': job.progress, 'frames_processed': job.frames_processed})
     return jsonify({'status': 'not_found', 'progress': 0})
 
+@app.route('/events')
+@login_required
+def events_route():
+    """Jeden strumień SSE z postępem wszystkich niezakończonych zadań zalogowanego użytkownika."""
+    jobs = Job.query.filter(Job.user_id == current_user.id, Job.status.in_(['queued', 'processing'])).all()
+    snapshot = [job_state(job) for job in jobs]
+    return Response(event_stream(redis_conn, current_user.id, snapshot), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics_route():
+    """Metryki w formacie Prometheusa: histogramy etapów analizy i liczniki zdarzeń ze wszystkich zadań, histogramy
+    oczekiwania w kolejkach i czasu trwania zadań, liczba zadań według statusu i długości kolejek.
+    Bez logowania (dla scrapera) - zawiera tylko agregaty."""
+    status = db.case((Job.status.like('failed%'), 'failed'), else_=Job.status)
+    job_statuses = dict(db.session.query(status, db.func.count(Job.id)).group_by(status).all())
+    body = render_prometheus(redis_conn, job_statuses, {name: len(queue) for name, queue in queues.items()})
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 @app.route('/results/<job_id>')
 @login_required
 def results_page(job_id):
@@ -133,25 +342,64 @@ def results_page(job_id):
         flash('Analiza nie została jeszcze zakończona.')
         return redirect(url_for('dashboard'))
 
-    frame_data = FrameData.query.filter_by(job_id=job_id).order_by(FrameData.frame_number).all()
-    
-    coords = [json.loads(fd.player_coords_json) for fd in frame_data if fd.player_coords_json]
-    # Filtruj tylko poprawne współrzędne (x, y)
-    path_coords = [(c['x'], c['y']) for c in coords if c and 'x' in c and 'y' in c]
+    # Trafienie cache wyników pokazuje klatki, wizualizację i obszary polowania oryginalnej analizy
+    data_job = result_job(job)
+    summary = frame_summary(data_job.id)
+
+    # Wizualizację rysuje worker po zakończeniu zadania. Dla starszych zadań zlecamy ją workerowi (raz na 10 minut),
+    # zamiast rysować w wątku obsługującym żądanie.
+    vis_pending = data_job.visualization is None
+    if vis_pending and redis_conn.set(f'vis_pending:{data_job.id}', 1, nx=True, ex=600):
+        queues['short'].enqueue('app.analysis.render_job_visualization', data_job.id)
+    vis_image_url = url_for('get_output_file', filename=data_job.visualization) if data_job.visualization else None
+
+    # Interaktywna mapa z kafelków, jeśli piramida kafelków została zbudowana (python -m app.tiles)
+    tiles = load_tiles_meta(os.path.join(app.static_folder, 'tiles'))
+    path_points = load_path_points(data_job.id).tolist() if tiles else []
+
+    metrics = json.loads(job.metrics_json) if job.metrics_json else {}
+    hunt_areas = json.loads(data_job.hunt_areas_json) if data_job.hunt_areas_json else []
+    return render_template('results.html', job=job, summary=summary, metrics=metrics, vis_image_url=vis_image_url,
+                           vis_pending=vis_pending, tiles=tiles, path_points=path_points, hunt_areas=hunt_areas)
+
+@app.route('/results/<job_id>/export.<fmt>')
+@login_required
+def export_results(job_id, fmt):
+    """Eksport wyników klatek jako JSON lub CSV. Odpowiedź jest strumieniowana paczkami po EXPORT_CHUNK_SIZE wierszy,
+    więc pamięć nie rośnie z długością zadania."""
+    if fmt not in ('json', 'csv'): abort(404)
+    data_job_id = result_job(Job.query.get_or_404(job_id)).id
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in iter_frame_rows(data_job_id):
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
 
-    # Generuj wizualizację, jeśli nie istnieje
-    vis_filename = f"{job_id}_path.png"
-    vis_filepath = os.path.join(app.config['OUTPUT_FOLDER'], vis_filename)
-    if not os.path.exists(vis_filepath) and len(path_coords) > 1:
-        visualize_path_and_hunt_area(path_coords, 'map.png', vis_filepath)
+    def generate_json():
+        yield '['
+        separator = ''
+        for rows in iter_frame_rows(data_job_id):
+            yield separator + ','.join(json.dumps(dict(zip(EXPORT_COLUMNS, row))) for row in rows)
+            separator = ','
+        yield ']'
 
-    return render_template('results.html', job=job, frame_count=len(frame_data), vis_image_url=url_for('get_output_file', filename=vis_filename))
+    generate, mimetype = (generate_csv, 'text/csv') if fmt == 'csv' else (generate_json, 'application/json')
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={job_id}_frames.{fmt}'})
 
 @app.route('/output/<filename>')
 @login_required
 def get_output_file(filename):
     """Serwuje pliki z katalogu wyjściowego (np. wizualizacje)."""
-    return send_from_directory(app.config['OUTPUT_FOLDER'], filename)
+    # Nazwy wizualizacji są adresowane treścią, więc przeglądarka może je trzymać w cache bez końca
+    max_age = 31536000 if filename.startswith('vis_') else None
+    return send_from_directory(app.config['OUTPUT_FOLDER'], filename, max_age=max_age)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0')
@@ -0,0 +1,125 @@
+# app/map_index.py
+# Indeks wyszukiwania pozycji minimapy na mapie świata.
+# Zamiast dopasowywać minimapę do całej mapy w pełnej rozdzielczości, dopasowujemy ją
+# najpierw do pomniejszonej kopii mapy (poziom zgrubny), a potem doprecyzowujemy
+# wynik w małym oknie w pełnej rozdzielczości. Indeks jest budowany raz i zapisywany obok mapy.
+
+import os
+import cv2
+import numpy as np
+
+INDEX_VERSION = 1
+
+
+def load_world_map_array(world_map_path, flags=cv2.IMREAD_GRAYSCALE):
+    """Wczytuje mapę świata jako tablicę mapowaną z pliku .npy (tworzonego przy pierwszym użyciu).
+    Strony pliku trafiają do pamięci podręcznej systemu, więc wszystkie procesy workera współdzielą jedną kopię mapy."""
+    suffix = 'gray' if flags == cv2.IMREAD_GRAYSCALE else 'bgr'
+    cache_path = f"{world_map_path}.{suffix}.npy"
+    if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(world_map_path):
+        world_map = cv2.imread(world_map_path, flags)
+        if world_map is None: raise FileNotFoundError(f"Nie można wczytać mapy: {world_map_path}")
+        try:
+            tmp_path = cache_path + '.tmp.npy'
+            np.save(tmp_path, world_map)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Nie można zapisać mapy w formacie .npy {cache_path}: {e}")
+            return world_map
+    return np.load(cache_path, mmap_mode='r')
+
+
+def load_world_map_gray(world_map_path):
+    return load_world_map_array(world_map_path, cv2.IMREAD_GRAYSCALE)
+
+
+class WorldMapIndex:
+    """Piramida mapy świata do szybkiej relokalizacji gracza."""
+    def __init__(self, world_map_gray, coarse, texture_mask, scale):
+        self.world_map_gray = world_map_gray
+        self.coarse = coarse
+        self.texture_mask = texture_mask
+        self.scale = scale
+
+    @staticmethod
+    def index_path(world_map_path, scale):
+        return f"{world_map_path}.index-s{scale}.npz"
+
+    @staticmethod
+    def _signature(world_map_path, scale):
+        st = os.stat(world_map_path)
+        return np.array([INDEX_VERSION, scale, st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+    @classmethod
+    def build(cls, world_map_gray, scale=4, texture_threshold=4.0):
+        """Buduje indeks: pomniejszoną mapę oraz maskę kafelków z teksturą (bez jednolitej wody/czerni)."""
+        h, w = world_map_gray.shape
+        coarse = cv2.resize(world_map_gray, (w // scale, h // scale), interpolation=cv2.INTER_AREA)
+        # Lokalne odchylenie standardowe w oknie 8x8 na poziomie zgrubnym
+        c = coarse.astype(np.float32)
+        mean = cv2.blur(c, (8, 8))
+        sq_mean = cv2.blur(c * c, (8, 8))
+        std = np.sqrt(np.maximum(sq_mean - mean * mean, 0))
+        texture_mask = std > texture_threshold
+        return cls(world_map_gray, coarse, texture_mask, scale)
+
+    @classmethod
+    def load_or_build(cls, world_map_path, world_map_gray=None, scale=4):
+        """Wczytuje indeks z dysku, a jeśli go brak lub mapa się zmieniła - buduje i zapisuje."""
+        if world_map_gray is None:
+            world_map_gray = cv2.imread(world_map_path, cv2.IMREAD_GRAYSCALE)
+            if world_map_gray is None: raise FileNotFoundError(f"Nie można wczytać mapy: {world_map_path}")
+        path = cls.index_path(world_map_path, scale)
+        signature = cls._signature(world_map_path, scale)
+        if os.path.exists(path):
+            try:
+                with np.load(path) as data:
+                    if np.array_equal(data['signature'], signature):
+                        return cls(world_map_gray, data['coarse'], data['texture_mask'], scale)
+            except (OSError, KeyError, ValueError):
+                pass  # Uszkodzony indeks - zbudujemy go od nowa
+        index = cls.build(world_map_gray, scale)
+        try:
+            np.savez(path, signature=signature, coarse=index.coarse, texture_mask=index.texture_mask)
+        except OSError as e:
+            print(f"Nie można zapisać indeksu mapy {path}: {e}")
+        return index
+
+    def _coarse_candidates(self, minimap_gray, top_k):
+        s = self.scale
+        h, w = minimap_gray.shape
+        small = cv2.resize(minimap_gray, (max(w // s, 1), max(h // s, 1)), interpolation=cv2.INTER_AREA)
+        if small.shape[0] > self.coarse.shape[0] or small.shape[1] > self.coarse.shape[1]: return []
+        result = cv2.matchTemplate(self.coarse, small, cv2.TM_CCOEFF_NORMED)
+        # Pomijamy pozycje, których środek leży w obszarze bez tekstury
+        sh, sw = small.shape
+        mask = self.texture_mask[sh // 2:sh // 2 + result.shape[0], sw // 2:sw // 2 + result.shape[1]]
+        result = np.where(mask, result, -1.0).astype(np.float32)
+        candidates = []
+        for _ in range(top_k):
+            _, max_val, _, (cx, cy) = cv2.minMaxLoc(result)
+            if max_val <= 0: break
+            candidates.append((cx * s, cy * s))
+            # Wygaszenie otoczenia znalezionego maksimum (non-maximum suppression)
+            result[max(cy - sh // 2, 0):cy + sh // 2 + 1, max(cx - sw // 2, 0):cx + sw // 2 + 1] = -1.0
+        return candidates
+
+    def match_window(self, minimap_gray, x, y, radius):
+        """Dopasowanie w pełnej rozdzielczości w oknie +/- radius wokół (x, y). Zwraca (x, y, score) lub None."""
+        h, w = minimap_gray.shape
+        map_h, map_w = self.world_map_gray.shape
+        x0, y0 = max(int(x) - radius, 0), max(int(y) - radius, 0)
+        x1, y1 = min(int(x) + w + radius, map_w), min(int(y) + h + radius, map_h)
+        if x1 - x0 < w or y1 - y0 < h: return None
+        result = cv2.matchTemplate(self.world_map_gray[y0:y1, x0:x1], minimap_gray, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        return (x0 + max_loc[0], y0 + max_loc[1], max_val)
+
+    def locate(self, minimap_gray, top_k=3):
+        """Zgrubne dopasowanie na pomniejszonej mapie, a następnie doprecyzowanie najlepszych kandydatów."""
+        if minimap_gray is None or minimap_gray.size == 0: return None
+        best = None
+        for cx, cy in self._coarse_candidates(minimap_gray, top_k):
+            match = self.match_window(minimap_gray, cx, cy, radius=2 * self.scale)
+            if match and (best is None or match[2] > best[2]): best = match
+        return best
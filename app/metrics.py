@@ -0,0 +1,178 @@
+# app/metrics.py
+# Instrumentacja przetwarzania: czasy etapów (dekodowanie, minimapa, pozycja, przepływ optyczny, battle lista, OCR,
+# paski HSV, pobieranie, zapis do bazy) i liczniki zdarzeń zbierane per zadanie.
+# Worker po zakończeniu zadania dopisuje jego histogramy do sum w Redis, z których /metrics tworzy eksport Prometheusa.
+# Osobno, per kolejka RQ, zbieramy czasy oczekiwania zadań w kolejce i czasy trwania przebiegów zadań.
+
+import bisect
+import time
+from contextlib import contextmanager
+import numpy as np
+
+# Granice kubełków histogramu czasów etapów (sekundy): ciąg geometryczny co pierwiastek z 2, od 0.1 ms do ok. 70 s
+STAGE_BUCKETS = tuple(1e-4 * 2 ** (i / 2) for i in range(40))
+# Klucze Redis z sumami metryk wszystkich zadań
+REDIS_STAGE_BUCKETS = 'metrics:stage_buckets:{stage}'
+REDIS_STAGE_SUMS = 'metrics:stage_sums'
+REDIS_COUNTERS = 'metrics:counters'
+REDIS_JOBS = 'metrics:jobs'
+# Kubełki (sekundy) czasu oczekiwania w kolejce i czasu trwania zadania - od sekund do wielu godzin
+JOB_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400, 28800)
+JOB_TIMINGS = ('queue_wait', 'duration')
+REDIS_JOB_BUCKETS = 'metrics:job_buckets:{kind}:{queue}'
+REDIS_JOB_SUMS = 'metrics:job_sums'
+# Cache wyników (app.result_cache): trafienia, chybienia, usunięte pliki/bajty i zaoszczędzony czas analizy
+REDIS_RESULT_CACHE = 'metrics:result_cache'
+
+
+class StageTimer:
+    """Czasy etapów (histogramy o stałym rozmiarze) i liczniki zdarzeń jednego zadania.
+    Obiekty zebrane w procesach segmentów łączy merge()."""
+    def __init__(self):
+        self.histograms = {}
+        self.totals = {}
+        self.maxima = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None: histogram = self.histograms[name] = np.zeros(len(STAGE_BUCKETS) + 1, np.int64)
+        # Kubełek i zawiera czasy z przedziału (STAGE_BUCKETS[i-1], STAGE_BUCKETS[i]], ostatni - dłuższe
+        histogram[bisect.bisect_left(STAGE_BUCKETS, seconds)] += 1
+        self.totals[name] = self.totals.get(name, 0.0) + seconds
+        if seconds > self.maxima.get(name, 0.0): self.maxima[name] = seconds
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other):
+        for name, histogram in other.histograms.items():
+            self.histograms[name] = self.histograms.get(name, 0) + histogram
+            self.totals[name] = self.totals.get(name, 0.0) + other.totals[name]
+            self.maxima[name] = max(self.maxima.get(name, 0.0), other.maxima[name])
+        for name, value in other.counters.items(): self.count(name, value)
+        return self
+
+    def quantile(self, name, q):
+        """Kwantyl czasu etapu (sekundy) z histogramu, interpolowany geometrycznie wewnątrz kubełka
+        i ograniczony najdłuższym zmierzonym czasem."""
+        histogram = self.histograms[name]
+        cumulative = np.cumsum(histogram)
+        rank = q * cumulative[-1]
+        i = int(np.searchsorted(cumulative, rank))
+        if i >= len(STAGE_BUCKETS): return self.maxima[name]
+        upper = STAGE_BUCKETS[i]
+        lower = STAGE_BUCKETS[i - 1] if i else upper / 2 ** 0.5
+        below = cumulative[i - 1] if i else 0
+        fraction = (rank - below) / histogram[i] if histogram[i] else 1.0
+        return min(lower * (upper / lower) ** fraction, self.maxima[name])
+
+    def summary(self):
+        """Metryki zadania do zapisania w Job.metrics_json: p50/p95/max i łączny czas każdego etapu oraz liczniki."""
+        stages = {name: {'count': int(histogram.sum()), 'total_s': round(self.totals[name], 4),
+                         'p50_ms': round(1000 * self.quantile(name, 0.5), 3), 'p95_ms': round(1000 * self.quantile(name, 0.95), 3),
+                         'max_ms': round(1000 * self.maxima[name], 3)}
+                  for name, histogram in sorted(self.histograms.items())}
+        summary = {'stages': stages, **self.counters}
+        if self.counters.get('tracking_frames'):
+            summary['tracking_loss_rate'] = self.counters.get('tracking_lost', 0) / self.counters['tracking_frames']
+        # Odsetek lokalizacji, przy których wystarczyło dopasowanie wokół ostatniej pozycji
+        if self.counters.get('local_relocalisations'):
+            local = self.counters['local_relocalisations']
+            summary['global_search_avoided_rate'] = local / (local + self.counters.get('relocalisations', 0))
+        return summary
+
+
+def publish_job_metrics(redis_conn, timer, status):
+    """Dopisuje histogramy i liczniki zadania do sum w Redis (czytanych przez /metrics).
+    status=None - bez liczenia zakończonego zadania (np. wspólne etapy analizy wsadowej)."""
+    pipe = redis_conn.pipeline(transaction=False)
+    for name, histogram in timer.histograms.items():
+        key = REDIS_STAGE_BUCKETS.format(stage=name)
+        for i in np.flatnonzero(histogram): pipe.hincrby(key, int(i), int(histogram[i]))
+        pipe.hincrbyfloat(REDIS_STAGE_SUMS, name, timer.totals[name])
+    for name, value in timer.counters.items(): pipe.hincrby(REDIS_COUNTERS, name, int(value))
+    if status: pipe.hincrby(REDIS_JOBS, status, 1)
+    pipe.execute()
+
+
+def publish_job_timing(redis_conn, kind, queue, seconds):
+    """Dopisuje czas oczekiwania w kolejce (kind='queue_wait') lub trwania przebiegu zadania ('duration') do histogramu kolejki."""
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.hincrby(REDIS_JOB_BUCKETS.format(kind=kind, queue=queue), bisect.bisect_left(JOB_BUCKETS, seconds), 1)
+    pipe.hincrbyfloat(REDIS_JOB_SUMS, f'{kind}:{queue}', seconds)
+    pipe.execute()
+
+
+def publish_cache_counters(redis_conn, **counters):
+    """Dopisuje liczniki cache wyników (hits, misses, evicted_files, evicted_bytes, saved_s)."""
+    pipe = redis_conn.pipeline(transaction=False)
+    for name, value in counters.items(): pipe.hincrbyfloat(REDIS_RESULT_CACHE, name, value)
+    pipe.execute()
+
+
+def _decode(mapping):
+    return {(k.decode() if isinstance(k, bytes) else k): float(v) for k, v in mapping.items()}
+
+
+def render_prometheus(redis_conn, job_statuses=None, queue_lengths=None):
+    """Tekst w formacie ekspozycji Prometheusa z sum zapisanych przez publish_job_metrics.
+    job_statuses (status -> liczba zadań w bazie) i queue_lengths (kolejka -> długość) są opcjonalnymi wskaźnikami."""
+    sums = _decode(redis_conn.hgetall(REDIS_STAGE_SUMS))
+    lines = ['# HELP tibiavision_stage_seconds Czas etapu przetwarzania klatki lub zadania',
+             '# TYPE tibiavision_stage_seconds histogram']
+    for name in sorted(sums):
+        buckets = _decode(redis_conn.hgetall(REDIS_STAGE_BUCKETS.format(stage=name)))
+        counts = [buckets.get(str(i), 0) for i in range(len(STAGE_BUCKETS) + 1)]
+        cumulative = np.cumsum(counts)
+        for bound, value in zip(STAGE_BUCKETS, cumulative):
+            lines.append(f'tibiavision_stage_seconds_bucket{{stage="{name}",le="{bound:.6g}"}} {int(value)}')
+        lines.append(f'tibiavision_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {int(cumulative[-1])}')
+        lines.append(f'tibiavision_stage_seconds_sum{{stage="{name}"}} {sums[name]}')
+        lines.append(f'tibiavision_stage_seconds_count{{stage="{name}"}} {int(cumulative[-1])}')
+    lines += ['# HELP tibiavision_events_total Zdarzenia analizy (relokalizacje, utraty śledzenia, ...)',
+              '# TYPE tibiavision_events_total counter']
+    for name, value in sorted(_decode(redis_conn.hgetall(REDIS_COUNTERS)).items()):
+        lines.append(f'tibiavision_events_total{{event="{name}"}} {int(value)}')
+    job_sums = _decode(redis_conn.hgetall(REDIS_JOB_SUMS))
+    for kind in JOB_TIMINGS:
+        queues = sorted(key.split(':', 1)[1] for key in job_sums if key.startswith(kind + ':'))
+        if not queues: continue
+        metric = f'tibiavision_job_{kind}_seconds'
+        lines += [f'# HELP {metric} ' + ('Czas oczekiwania zadania w kolejce RQ' if kind == 'queue_wait' else 'Czas trwania przebiegu zadania'),
+                  f'# TYPE {metric} histogram']
+        for queue in queues:
+            buckets = _decode(redis_conn.hgetall(REDIS_JOB_BUCKETS.format(kind=kind, queue=queue)))
+            cumulative = np.cumsum([buckets.get(str(i), 0) for i in range(len(JOB_BUCKETS) + 1)])
+            for bound, value in zip(JOB_BUCKETS, cumulative):
+                lines.append(f'{metric}_bucket{{queue="{queue}",le="{bound}"}} {int(value)}')
+            lines.append(f'{metric}_bucket{{queue="{queue}",le="+Inf"}} {int(cumulative[-1])}')
+            lines.append(f'{metric}_sum{{queue="{queue}"}} {job_sums[f"{kind}:{queue}"]}')
+            lines.append(f'{metric}_count{{queue="{queue}"}} {int(cumulative[-1])}')
+    result_cache = _decode(redis_conn.hgetall(REDIS_RESULT_CACHE))
+    if result_cache:
+        saved = result_cache.pop('saved_s', 0.0)
+        lines += ['# HELP tibiavision_result_cache_total Zdarzenia cache wyników analizy (trafienia, chybienia, usunięte pliki i bajty)',
+                  '# TYPE tibiavision_result_cache_total counter']
+        lines += [f'tibiavision_result_cache_total{{event="{name}"}} {int(value)}' for name, value in sorted(result_cache.items())]
+        lines += ['# HELP tibiavision_result_cache_saved_seconds_total Czas analizy zaoszczędzony dzięki trafieniom cache wyników',
+                  '# TYPE tibiavision_result_cache_saved_seconds_total counter', f'tibiavision_result_cache_saved_seconds_total {saved}']
+    lines += ['# HELP tibiavision_jobs_finished_total Zakończone zadania według wyniku',
+              '# TYPE tibiavision_jobs_finished_total counter']
+    for status, value in sorted(_decode(redis_conn.hgetall(REDIS_JOBS)).items()):
+        lines.append(f'tibiavision_jobs_finished_total{{status="{status}"}} {int(value)}')
+    if job_statuses is not None:
+        lines += ['# HELP tibiavision_jobs Zadania w bazie według statusu', '# TYPE tibiavision_jobs gauge']
+        lines += [f'tibiavision_jobs{{status="{status}"}} {count}' for status, count in sorted(job_statuses.items())]
+    if queue_lengths is not None:
+        lines += ['# HELP tibiavision_queue_length Zadania oczekujące w kolejce RQ', '# TYPE tibiavision_queue_length gauge']
+        lines += [f'tibiavision_queue_length{{queue="{name}"}} {length}' for name, length in sorted(queue_lengths.items())]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,134 @@
+# app/migrate_results.py
+# Migracja istniejącej bazy app.db do kolumnowego formatu wyników.
+# Dodaje brakujące tabele, kolumny i indeksy, przepisuje dane z kolumn JSON do kolumn liczbowych FrameData
+# i tabeli battle_list_entry, a dla zakończonych zadań tworzy artefakty NPZ z szeregiem czasowym.
+# Użycie: python -m app.migrate_results [--keep-json]
+
+import os
+import sys
+import json
+import argparse
+import sqlalchemy as sa
+
+from app.main import app, db, Job, FrameData, BattleListEntry
+from app.storage import frame_row, battle_list_rows, artifact_path, save_frame_artifact, ARTIFACT_COLUMNS
+
+BATCH_SIZE = 5000
+
+
+def add_missing_columns():
+    """Dodaje do istniejących tabel kolumny modeli, których w nich brakuje (ALTER TABLE ADD COLUMN)."""
+    inspector = sa.inspect(db.engine)
+    added = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name): continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing: continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            db.session.execute(sa.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            added.append(f"{table.name}.{column.name}")
+    db.session.commit()
+    return added
+
+
+def add_missing_indexes():
+    """Tworzy indeksy zdefiniowane w modelach, których brakuje w istniejącej bazie."""
+    inspector = sa.inspect(db.engine)
+    added = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name): continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing: continue
+            index.create(bind=db.engine)
+            added.append(index.name)
+    return added
+
+
+NUMERIC_COLUMNS = ('x', 'y', 'z', 'hp', 'mana')
+JSON_COLUMNS = ('player_coords_json', 'stats_json', 'battle_list_json')
+
+
+def migrate_job(job_id, keep_json):
+    """Przepisuje wiersze JSON jednego zadania, których kolumny liczbowe nie są jeszcze ustawione, do kolumn liczbowych,
+    paczkami po BATCH_SIZE. Wpisy battle listy są dodawane tylko dla klatek, które jeszcze ich nie mają,
+    więc ponowne uruchomienie (np. z --keep-json) nie tworzy duplikatów."""
+    table, entries = FrameData.__table__, BattleListEntry.__table__
+    update = table.update().where(table.c.id == sa.bindparam('row_id')).values(
+        x=sa.bindparam('x'), y=sa.bindparam('y'), z=sa.bindparam('z'), hp=sa.bindparam('hp'), mana=sa.bindparam('mana'))
+    clear_json = table.update().where(table.c.id == sa.bindparam('row_id')).values(
+        player_coords_json=None, stats_json=None, battle_list_json=None)
+    migrated, last_id = 0, 0
+    while True:
+        rows = db.session.execute(
+            sa.select(table.c.id, table.c.frame_number, table.c.timestamp, table.c.player_coords_json, table.c.stats_json, table.c.battle_list_json)
+            .where(table.c.job_id == job_id, table.c.id > last_id,
+                   sa.or_(*[table.c[name].isnot(None) for name in JSON_COLUMNS]),
+                   *[table.c[name].is_(None) for name in NUMERIC_COLUMNS])
+            .order_by(table.c.id).limit(BATCH_SIZE)).all()
+        if not rows: break
+        with_entries = set(db.session.execute(
+            sa.select(entries.c.frame_number).distinct()
+            .where(entries.c.job_id == job_id, entries.c.frame_number.in_([row.frame_number for row in rows]))).scalars())
+        updates, battle_entries = [], []
+        for row in rows:
+            result = {'player_coords': json.loads(row.player_coords_json or 'null'), 'stats': json.loads(row.stats_json or 'null')}
+            values = frame_row(job_id, row.frame_number, row.timestamp, result)
+            updates.append({'row_id': row.id, **{name: values[name] for name in NUMERIC_COLUMNS}})
+            if row.frame_number not in with_entries:
+                battle_entries.extend(battle_list_rows(job_id, row.frame_number, json.loads(row.battle_list_json or '[]')))
+        db.session.execute(update, updates)
+        if battle_entries: db.session.execute(entries.insert(), battle_entries)
+        if not keep_json: db.session.execute(clear_json, [{'row_id': u['row_id']} for u in updates])
+        db.session.commit()
+        migrated += len(rows)
+        last_id = rows[-1].id
+    return migrated
+
+
+def clear_job_json(job_id):
+    """Czyści kolumny JSON wierszy zadania, które je jeszcze mają (np. przeniesionych wcześniej z --keep-json).
+    Zwraca liczbę wyczyszczonych wierszy."""
+    table = FrameData.__table__
+    result = db.session.execute(table.update()
+                                .where(table.c.job_id == job_id, sa.or_(*[table.c[name].isnot(None) for name in JSON_COLUMNS]))
+                                .values(**{name: None for name in JSON_COLUMNS}))
+    db.session.commit()
+    return result.rowcount
+
+
+def write_artifact(job_id):
+    """Tworzy artefakt NPZ zadania z kolumn liczbowych FrameData."""
+    table = FrameData.__table__
+    rows = db.session.execute(sa.select(*[table.c[name] for name in ARTIFACT_COLUMNS])
+                              .where(table.c.job_id == job_id).order_by(table.c.frame_number)).all()
+    columns = {name: [-1 if row[i] is None else row[i] for row in rows] for i, name in enumerate(ARTIFACT_COLUMNS)}
+    save_frame_artifact(artifact_path(job_id, app.config['OUTPUT_FOLDER']), columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migracja wyników do formatu kolumnowego")
+    parser.add_argument('--keep-json', action='store_true', help="Nie czyść starych kolumn JSON po migracji")
+    args = parser.parse_args()
+    with app.app_context():
+        db.create_all()
+        for name in add_missing_columns(): print(f"Dodano kolumnę {name}")
+        for name in add_missing_indexes(): print(f"Utworzono indeks {name}")
+        os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
+        for job in Job.query.all():
+            migrated = migrate_job(job.id, args.keep_json)
+            if job.status == 'completed' and (migrated or not os.path.exists(artifact_path(job.id, app.config['OUTPUT_FOLDER']))):
+                write_artifact(job.id)
+            cleared = 0 if args.keep_json else clear_job_json(job.id)
+            print(f"Zadanie {job.id}: przeniesiono {migrated} klatek" + (f", wyczyszczono JSON {cleared} klatek" if cleared else ''))
+        if not args.keep_json:
+            # Odzyskanie miejsca po wyczyszczonych kolumnach JSON (VACUUM nie działa wewnątrz transakcji)
+            db.session.remove()
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(sa.text('VACUUM'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+# app/ocr_cache.py
+# Rozpoznawanie nazw z battle listy: jedno wywołanie rozpoznawania dla wszystkich wierszy klatki
+# oraz pamięć podręczna LRU, kluczowana percepcyjnym hashem paska z nazwą.
+
+import os
+import time
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+OCR_CACHE_SIZE = int(os.getenv('OCR_CACHE_SIZE', '4096'))
+# Wysokość części wiersza z nazwą (poniżej jest pasek HP, który nie może wpływać na klucz cache)
+NAME_STRIP_HEIGHT = 12
+
+
+def name_strip_hash(entry_gray):
+    """Percepcyjny hash (dHash w połowie rozdzielczości) paska z nazwą - odporny na drobny szum kompresji."""
+    strip = entry_gray[:NAME_STRIP_HEIGHT]
+    small = cv2.resize(strip, (strip.shape[1] // 2 + 1, strip.shape[0] // 2), interpolation=cv2.INTER_AREA)
+    return np.packbits(small[:, 1:] > small[:, :-1]).tobytes()
+
+
+class NameRecognizer:
+    """Odczytuje nazwy wierszy battle listy, korzystając z cache i zbiorczego wywołania recognizera EasyOCR."""
+    def __init__(self, ocr_reader, max_size=OCR_CACHE_SIZE):
+        self.ocr_reader = ocr_reader
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.ocr_time = 0.0
+        self.ocr_calls = 0
+
+    def _get(self, key):
+        if key not in self.entries: return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def _put(self, key, name):
+        self.entries[key] = name
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size: self.entries.popitem(last=False)
+
+    def _recognize(self, rows_gray):
+        """Jedno wywołanie recognizera (bez detektora tekstu) dla wszystkich wierszy złożonych w jeden obraz."""
+        height, width = rows_gray[0].shape
+        stacked = np.ascontiguousarray(np.vstack(rows_gray))
+        boxes = [[0, width, i * height, (i + 1) * height] for i in range(len(rows_gray))]
+        start = time.perf_counter()
+        result = self.ocr_reader.recognize(stacked, horizontal_list=boxes, free_list=[], detail=1, batch_size=len(boxes))
+        self.ocr_time += time.perf_counter() - start
+        self.ocr_calls += 1
+        names = [''] * len(rows_gray)
+        for box, text, _ in result:
+            index = min(int(box[0][1]) // height, len(rows_gray) - 1)
+            names[index] = f"{names[index]} {text}".strip()
+        return names
+
+    def read_names(self, rows_gray):
+        """Zwraca nazwy dla listy wierszy (obrazy w skali szarości). Pusty napis oznacza brak rozpoznanej nazwy."""
+        keys = [name_strip_hash(row) for row in rows_gray]
+        names = [self._get(key) for key in keys]
+        # Powtórzone wiersze (np. ten sam stwór w kolejnych klatkach paczki analizy wsadowej) rozpoznajemy raz
+        missing = {}
+        for i, name in enumerate(names):
+            if name is None: missing.setdefault(keys[i], []).append(i)
+        self.hits += len(rows_gray) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            # Do OCR trafia ten sam pasek z nazwą, z którego liczony jest klucz - pasek HP nie zmienia odczytanego tekstu
+            strips = [rows_gray[indices[0]][:NAME_STRIP_HEIGHT] for indices in missing.values()]
+            for (key, indices), name in zip(missing.items(), self._recognize(strips)):
+                for i in indices: names[i] = name
+                self._put(key, name)
+        return names
+
+    def pop_metrics(self):
+        """Zwraca liczniki od ostatniego wywołania i je zeruje (zawartość cache zostaje)."""
+        metrics = {'ocr_s': self.ocr_time, 'ocr_calls': self.ocr_calls, 'ocr_cache_hits': self.hits, 'ocr_cache_misses': self.misses}
+        self.ocr_time, self.ocr_calls, self.hits, self.misses = 0.0, 0, 0, 0
+        return metrics
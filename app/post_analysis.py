@@ -1,60 +1,64 @@
 # app/post_analysis.py
 # Moduł do analizy i wizualizacji wyników po zakończeniu przetwarzania.
 
+import os
+import json
+import hashlib
 import cv2
 import numpy as np
-from sklearn.cluster import DBSCAN
 
-def visualize_path_and_hunt_area(coords, world_map_path, output_path):
+from app.map_index import load_world_map_array
+from app.hunt_areas import find_hunt_areas
+
+# Margines (w pikselach mapy) wokół ścieżki w przyciętej wizualizacji
+VIS_MARGIN = 64
+# Zmiana sposobu rysowania wymaga zmiany wersji - inaczej zostałyby użyte stare pliki z cache
+VIS_VERSION = 2
+
+def visualization_filename(coords, world_map_path, hunt_areas=None):
+    """Nazwa pliku adresowana treścią: skrót współrzędnych ścieżki, obszarów polowania, wersji mapy i wersji rysowania."""
+    digest = hashlib.sha1(f"{VIS_VERSION}:{os.path.getsize(world_map_path)}:{os.path.getmtime(world_map_path)}".encode())
+    digest.update(np.ascontiguousarray(coords, dtype=np.int32).tobytes())
+    digest.update(json.dumps(hunt_areas or [], sort_keys=True).encode())
+    return f"vis_{digest.hexdigest()[:24]}.png"
+
+def render_visualization(coords, world_map_path, output_folder, hunt_areas=None):
+    """Zwraca nazwę pliku wizualizacji ścieżki, rysując ją tylko wtedy, gdy nie ma jej jeszcze w cache."""
+    filename = visualization_filename(coords, world_map_path, hunt_areas)
+    output_path = os.path.join(output_folder, filename)
+    if not os.path.exists(output_path):
+        tmp_path = output_path + '.tmp.png'
+        visualize_path_and_hunt_area(coords, world_map_path, tmp_path, hunt_areas)
+        os.replace(tmp_path, output_path)
+    return filename
+
+def visualize_path_and_hunt_area(coords, world_map_path, output_path, hunt_areas=None, margin=VIS_MARGIN):
     """
-    Rysuje ścieżkę gracza na mapie świata, identyfikuje i zaznacza 
-    główny obszar polowania (hunt).
+    Rysuje ścieżkę gracza na wycinku mapy świata (prostokąt otaczający ścieżkę + margines)
+    i zaznacza obszary polowania (hunt). Bez podanych obszarów wyznacza je z samej ścieżki.
     """
-    world_map = cv2.imread(world_map_path)
-    if world_map is None:
-        raise FileNotFoundError("Nie można wczytać mapy świata do wizualizacji.")
+    full_map = load_world_map_array(world_map_path, cv2.IMREAD_COLOR)
+    if hunt_areas is None: hunt_areas = find_hunt_areas(coords)
 
-    # Rysowanie ścieżki
+    # Przycięcie mapy do obszaru ścieżki - rysujemy na kopii wycinka, a nie na całej mapie
     points = np.array(coords, np.int32)
-    cv2.polylines(world_map, [points], isClosed=False, color=(75, 0, 130), thickness=2)
+    x0, y0 = np.maximum(points.min(axis=0) - margin, 0)
+    x1, y1 = np.minimum(points.max(axis=0) + margin + 1, (full_map.shape[1], full_map.shape[0]))
+    world_map = np.array(full_map[y0:y1, x0:x1])
+    points = (points - (x0, y0)).astype(np.int32)
 
-    # Identyfikacja obszaru polowania za pomocą DBSCAN
-    if len(coords) > 50: # Wymagaj minimalnej liczby punktów do analizy
-        # eps: maksymalna odległość między próbkami, aby uznać je za sąsiadów
-        # min_samples: liczba próbek w sąsiedztwie, aby uznać punkt za rdzeń
-        db = DBSCAN(eps=50, min_samples=20).fit(coords)
-        labels = db.labels_
-        
-        # Znajdź największy klaster (ignorując szum oznaczony jako -1)
-        unique_labels = set(labels)
-        if len(unique_labels) > 1:
-            core_samples_mask = np.zeros_like(db.labels_, dtype=bool)
-            core_samples_mask[db.core_sample_indices_] = True
-            
-            largest_cluster_label = -1
-            max_size = 0
-            for k in unique_labels:
-                if k == -1: continue # Pomiń szum
-                
-                class_member_mask = (labels == k)
-                size = np.sum(class_member_mask & core_samples_mask)
-                if size > max_size:
-                    max_size = size
-                    largest_cluster_label = k
-            
-            # Jeśli znaleziono znaczący klaster, zaznacz go
-            if largest_cluster_label != -1:
-                cluster_points = points[labels == largest_cluster_label]
-                # Oblicz prostokąt otaczający klaster
-                x, y, w, h = cv2.boundingRect(cluster_points)
-                # Narysuj półprzezroczysty prostokąt
-                sub_img = world_map[y:y+h, x:x+w]
-                white_rect = np.ones(sub_img.shape, dtype=np.uint8) * 255
-                res = cv2.addWeighted(sub_img, 0.7, white_rect, 0.3, 1.0)
-                world_map[y:y+h, x:x+w] = res
-                # Dodaj etykietę
-                cv2.putText(world_map, "Hunt Area", (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 255, 0), 2)
+    # Rysowanie ścieżki
+    cv2.polylines(world_map, [points], isClosed=False, color=(75, 0, 130), thickness=2)
 
+    # Zaznaczenie wszystkich obszarów polowania (od najdłuższego czasu spędzonego w obszarze)
+    for rank, area in enumerate(hunt_areas or [], 1):
+        # Półprzezroczysty prostokąt (obcięty do wycinka)
+        x, y = max(area['x'] - x0, 0), max(area['y'] - y0, 0)
+        x_end, y_end = area['x'] + area['w'] - x0, area['y'] + area['h'] - y0
+        sub_img = world_map[y:y_end, x:x_end]
+        world_map[y:y_end, x:x_end] = cv2.addWeighted(sub_img, 0.7, np.full_like(sub_img, 255), 0.3, 1.0)
+        label = f"Hunt {rank} ({area['seconds'] / 60:.0f} min)" if area.get('seconds') else f"Hunt {rank}"
+        cv2.putText(world_map, label, (x, max(y - 10, 20)), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 255, 0), 2)
 
     # Zapisz wynikowy obraz
     cv2.imwrite(output_path, world_map)
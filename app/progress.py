@@ -0,0 +1,87 @@
+# app/progress.py
+# Postęp zadań przez Redis zamiast odpytywania bazy przez przeglądarkę.
+# Worker trzyma ostatni stan zadania w kluczu Redis i publikuje go na kanale właściciela zadania (pub/sub),
+# a strona WWW udostępnia jeden strumień SSE (/events) z aktualizacjami wszystkich zadań użytkownika.
+
+import os
+import json
+import time
+from redis.exceptions import RedisError
+
+# Jak długo trzymamy ostatni stan zadania w Redis (sekundy)
+PROGRESS_TTL = 86400
+# Co ile sekund strumień SSE wysyła komentarz podtrzymujący połączenie (i wykrywa zamknięte karty)
+SSE_KEEPALIVE = float(os.getenv('SSE_KEEPALIVE', '15'))
+# Maksymalny czas jednego połączenia SSE; przeglądarka (EventSource) sama łączy się ponownie
+SSE_MAX_DURATION = float(os.getenv('SSE_MAX_DURATION', '600'))
+# Statusy, po których zadanie już się nie zmienia
+FINAL_STATUSES = ('completed', 'failed')
+
+
+def state_key(job_id):
+    return f"job_state:{job_id}"
+
+
+def user_channel(user_id):
+    return f"job_progress:{user_id}"
+
+
+def is_final(status):
+    return status.startswith(FINAL_STATUSES)
+
+
+def job_state(job):
+    """Stan zadania w formacie zdarzeń postępu (z wiersza Job)."""
+    return {'job_id': job.id, 'status': job.status, 'progress': job.progress, 'frames_processed': job.frames_processed}
+
+
+def load_states(redis_conn, job_ids):
+    """Ostatnie opublikowane stany zadań (jedno MGET). Zadania bez stanu w Redis są pomijane."""
+    if not job_ids: return {}
+    values = redis_conn.mget([state_key(job_id) for job_id in job_ids])
+    return {job_id: json.loads(value) for job_id, value in zip(job_ids, values) if value}
+
+
+class ProgressPublisher:
+    """Publikuje postęp jednego zadania. Błędy Redis nie przerywają analizy - postęp trafia też do bazy."""
+    def __init__(self, redis_conn, job_id, user_id):
+        self.redis_conn = redis_conn
+        self.job_id = job_id
+        self.channel = user_channel(user_id)
+        self.published = 0
+
+    def publish(self, status, progress, frames_processed):
+        message = json.dumps({'job_id': self.job_id, 'status': status, 'progress': progress, 'frames_processed': frames_processed})
+        try:
+            pipe = self.redis_conn.pipeline(transaction=False)
+            pipe.set(state_key(self.job_id), message, ex=PROGRESS_TTL)
+            pipe.publish(self.channel, message)
+            pipe.execute()
+            self.published += 1
+        except RedisError as e:
+            print(f"Nie udało się opublikować postępu zadania {self.job_id}: {e}")
+
+
+def _sse(data):
+    return f"data: {json.dumps(data)}\n\n"
+
+
+def event_stream(redis_conn, user_id, snapshot, keepalive=SSE_KEEPALIVE, max_duration=SSE_MAX_DURATION):
+    """Generator strumienia SSE dla użytkownika. snapshot to stany jego niezakończonych zadań z bazy;
+    przed ich wysłaniem nadpisujemy je świeższymi stanami z Redis (subskrypcja jest już aktywna, więc nic nie ginie)."""
+    pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(user_channel(user_id))
+    try:
+        fresh = load_states(redis_conn, [state['job_id'] for state in snapshot])
+        for state in snapshot:
+            yield _sse(fresh.get(state['job_id'], state))
+        deadline = time.monotonic() + max_duration
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=keepalive)
+            if message and message['type'] == 'message':
+                data = message['data']
+                yield f"data: {data.decode() if isinstance(data, bytes) else data}\n\n"
+            else:
+                yield ": keepalive\n\n"
+    finally:
+        pubsub.close()
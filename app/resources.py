@@ -0,0 +1,44 @@
+# app/resources.py
+# Zasoby analizatora wczytywane raz na proces workera i współdzielone przez kolejne zadania:
+# mapa świata (mapowana z pliku), indeks mapy, model EasyOCR i szablony elementów interfejsu.
+
+import time
+import cv2
+import easyocr
+
+from app.map_index import WorldMapIndex, load_world_map_gray
+
+# Szablony elementów interfejsu wczytywane z góry (brak pliku = położenie domyślne w analizatorze)
+UI_TEMPLATES = {
+    'minimap': 'app/templates/assets/minimap_corner.png',
+    'battle_list': 'app/templates/assets/battle_list_header.png',
+}
+
+
+class AnalyzerResources:
+    """Niezmienne, kosztowne w przygotowaniu zasoby współdzielone przez wszystkie analizatory w procesie.
+    ocr_reader pozwala podać gotowy obiekt z interfejsem easyocr.Reader (np. w benchmarkach offline)."""
+    def __init__(self, world_map_path='map.png', lang='en', ocr_reader=None):
+        start = time.perf_counter()
+        self.world_map_gray = load_world_map_gray(world_map_path)
+        self.map_index = WorldMapIndex.load_or_build(world_map_path, self.world_map_gray)
+        self.ocr_reader = ocr_reader or easyocr.Reader([lang])
+        self.templates = {}
+        for path in UI_TEMPLATES.values(): self.template(path)
+        self.load_time = time.perf_counter() - start
+
+    def template(self, path):
+        """Szablon w skali szarości (lub None, jeśli pliku brak) - z dysku czytany tylko raz."""
+        if path not in self.templates: self.templates[path] = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        return self.templates[path]
+
+
+_shared_resources = {}
+
+
+def get_shared_resources(world_map_path='map.png', lang='en', ocr_reader=None):
+    """Zwraca zasoby dla danej mapy i języka, tworząc je przy pierwszym wywołaniu w procesie.
+    Wywołane w procesie głównym workera przed fork() - procesy potomne dziedziczą gotowe zasoby."""
+    key = (world_map_path, lang)
+    if key not in _shared_resources: _shared_resources[key] = AnalyzerResources(world_map_path, lang, ocr_reader)
+    return _shared_resources[key]
@@ -0,0 +1,115 @@
+# app/result_cache.py
+# Cache wyników analizy dla powtarzanych nagrań. Klucz zadania łączy identyfikator źródła (ID filmu YouTube,
+# znormalizowany URL albo SHA-256 treści przesłanego pliku) z parametrami analizy i wersją analizatora.
+# Zadanie, dla którego klucza istnieje zakończona analiza, od razu dostaje jej wyniki (Job.result_job_id),
+# bez pobierania i analizowania nagrania. Przesłane nagrania i artefakty NPZ wyników (odtwarzalne z bazy)
+# są usuwane od najdawniej używanych, gdy ich łączny rozmiar przekroczy RESULT_CACHE_MAX_MB.
+
+import os
+import re
+import time
+import hashlib
+from urllib.parse import urlsplit, parse_qs
+
+# Wersja analizatora - zmiana wyników analizy klatek musi ją podbić, żeby starsze wyniki nie były używane ponownie
+ANALYZER_VERSION = '2026.10'
+# 0 = każde zlecenie jest analizowane od nowa
+RESULT_CACHE = os.getenv('RESULT_CACHE', '1') == '1'
+# Limit łącznego rozmiaru przesłanych nagrań i artefaktów wyników (MB)
+RESULT_CACHE_MAX_MB = int(os.getenv('RESULT_CACHE_MAX_MB', '20480'))
+# Pliki nowsze niż tyle sekund nie są usuwane (nagranie zapisywane przed utworzeniem zadania w bazie)
+EVICT_MIN_AGE = 3600
+# Artefakt NPZ wyników zadania (app.storage.artifact_path)
+ARTIFACT_SUFFIX = '_frames.npz'
+HASH_CHUNK_SIZE = 1 << 20
+
+_YOUTUBE_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+
+def youtube_video_id(url):
+    """ID filmu z linku YouTube (watch?v=, youtu.be/, shorts/, embed/, live/) lub None."""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower().removeprefix('www.').removeprefix('m.')
+    if host == 'youtu.be':
+        candidate = parts.path.strip('/').split('/')[0]
+    elif host == 'youtube.com' or host.endswith('.youtube.com'):
+        segments = parts.path.strip('/').split('/')
+        if segments[0] == 'watch': candidate = parse_qs(parts.query).get('v', [''])[0]
+        elif len(segments) > 1 and segments[0] in ('shorts', 'embed', 'live', 'v'): candidate = segments[1]
+        else: return None
+    else:
+        return None
+    return candidate if _YOUTUBE_ID.match(candidate) else None
+
+
+def source_id(source_type, source_data):
+    """Identyfikator źródła niezależny od postaci linku: 'youtube:<id>' albo 'url:<URL bez fragmentu>'; None - brak."""
+    if not source_data: return None
+    if source_type == 'youtube':
+        video_id = youtube_video_id(source_data)
+        return f"youtube:{video_id}" if video_id else None
+    if source_type == 'url':
+        parts = urlsplit(source_data.strip())
+        return "url:" + parts._replace(scheme=parts.scheme.lower(), netloc=parts.netloc.lower(), fragment='').geturl()
+    return None
+
+
+def save_upload(file_storage, path):
+    """Zapisuje przesłany plik, licząc przy tym SHA-256 jego treści. Zwraca identyfikator źródła 'sha256:<hex>'."""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as out:
+        for chunk in iter(lambda: file_storage.stream.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            out.write(chunk)
+    return f"sha256:{digest.hexdigest()}"
+
+
+def cache_key(source, frame_skip, sample_fps=None):
+    """Klucz cache wyników: źródło, parametry próbkowania i wersja analizatora. None, jeśli źródło jest nieznane."""
+    if source is None or not RESULT_CACHE: return None
+    return hashlib.sha256(f"{source}|{int(frame_skip)}|{float(sample_fps or 0)}|{ANALYZER_VERSION}".encode()).hexdigest()
+
+
+def cached_files(upload_folder, output_folder):
+    """Pliki objęte limitem cache: [(ścieżka, id zadania, rozmiar, czas ostatniego użycia)].
+    Nazwy przesłanych nagrań i artefaktów zaczynają się od id zadania."""
+    files = []
+    for folder, suffix in ((upload_folder, ''), (output_folder, ARTIFACT_SUFFIX)):
+        try:
+            entries = list(os.scandir(folder))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if not entry.is_file() or not entry.name.endswith(suffix) or '_' not in entry.name: continue
+            st = entry.stat()
+            files.append((entry.path, entry.name.split('_', 1)[0], st.st_size, st.st_mtime))
+    return files
+
+
+def touch(paths):
+    """Oznacza pliki jako użyte (czas modyfikacji) - eksmisja usuwa najpierw najdawniej używane."""
+    now = time.time()
+    for path in paths:
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+
+
+def evict(files, max_bytes, evictable):
+    """Usuwa najdawniej używane pliki, aż łączny rozmiar spadnie do max_bytes.
+    evictable(id zadania) - czy pliki zadania można usunąć (np. nie trwa jego analiza). Zwraca (liczba plików, bajty)."""
+    total = sum(size for _, _, size, _ in files)
+    removed = freed = 0
+    newest = time.time() - EVICT_MIN_AGE
+    for path, job_id, size, used in sorted(files, key=lambda f: f[3]):
+        if total <= max_bytes: break
+        if used > newest or not evictable(job_id): continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+        freed += size
+    return removed, freed
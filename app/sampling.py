@@ -0,0 +1,72 @@
+# app/sampling.py
+# Wybór klatek do analizy po stronie dekodera.
+# Klatki pomijane są tylko pobierane przez grab() (bez retrieve(), czyli bez konwersji do BGR i kopiowania),
+# a przy dużych odstępach między analizowanymi klatkami dekoder przeskakuje do celu przez seek.
+
+import os
+import math
+import time
+import cv2
+
+# Minimalny odstęp (w klatkach), od którego zamiast grab() używamy seeka. Powinien przekraczać typowy GOP.
+SEEK_THRESHOLD = int(os.getenv('SEEK_THRESHOLD', '300'))
+
+
+def sampling_step(frame_skip=0, sample_fps=None, fps=None):
+    """Odstęp między analizowanymi klatkami: z frame_skip albo z liczby klatek na sekundę czasu gry."""
+    if sample_fps and fps: return max(fps / sample_fps, 1.0)
+    return float(frame_skip + 1)
+
+
+class FrameSampler:
+    """Iterator po analizowanych klatkach wideo: zwraca (frame_number, timestamp, frame).
+    Jeśli podano timer (app.metrics.StageTimer), zapisuje w nim czas dekodowania każdej klatki (etap 'decode')."""
+    def __init__(self, cap, step, start_frame=0, end_frame=None, seekable=True, seek_threshold=SEEK_THRESHOLD, timer=None):
+        self.cap = cap
+        self.step = step
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.seekable = seekable
+        self.seek_threshold = seek_threshold
+        self.timer = timer
+        # Statystyki dekodowania
+        self.decode_time = 0.0
+        self.frames_grabbed = 0
+        self.frames_retrieved = 0
+        self.seeks = 0
+
+    def stats(self):
+        return {'decode_s': self.decode_time, 'frames_grabbed': self.frames_grabbed,
+                'frames_retrieved': self.frames_retrieved, 'seeks': self.seeks}
+
+    def __iter__(self):
+        # Strumienia bez przewijania nie przesuwamy seekiem - klatki przed start_frame są tylko pobierane przez grab()
+        cap, position = self.cap, self.start_frame if self.seekable else 0
+        # Cele są wyznaczane globalnie (k * step), żeby segmenty wideo próbkowały te same klatki co analiza sekwencyjna
+        k = math.ceil(self.start_frame / self.step)
+        start = time.perf_counter()
+        if self.start_frame and self.seekable:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+            self.seeks += 1
+        self.decode_time += time.perf_counter() - start
+        while True:
+            target = round(k * self.step)
+            if self.end_frame is not None and target >= self.end_frame: break
+            start = time.perf_counter()
+            if self.seekable and target - position > self.seek_threshold:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                self.seeks += 1
+                position = target
+            while position < target:
+                if not cap.grab(): break
+                self.frames_grabbed += 1
+                position += 1
+            ok, frame = cap.read() if position == target else (False, None)
+            elapsed = time.perf_counter() - start
+            self.decode_time += elapsed
+            if not ok: break
+            if self.timer: self.timer.record('decode', elapsed)
+            self.frames_retrieved += 1
+            position += 1
+            yield target, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, frame
+            k += 1
@@ -0,0 +1,136 @@
+# app/scheduling.py
+# Kolejki zadań analizy. Klasa kolejki (short/long/bulk) jest wybierana przy zlecaniu zadania z przewidywanej liczby
+# analizowanych klatek, każda klasa ma własny limit czasu przebiegu, a zadania przerwane przez limit czasu
+# lub śmierć procesu workera są ponawiane (RQ Retry). Błędy danych wejściowych kończą zadanie od razu.
+# Ponowiony lub przerwany (np. restart kontenerów przez cron) przebieg wznawia analizę od ostatniego punktu
+# kontrolnego Job.last_frame zapisanego razem z paczką wyników, zamiast zaczynać od początku.
+
+import os
+import time
+import socket
+from datetime import datetime
+import cv2
+from rq import Queue, Retry, Worker, get_current_job
+from rq.defaults import DEFAULT_JOB_MONITORING_INTERVAL
+from rq.job import Job as QueueJob
+from rq.timeouts import JobTimeoutException
+from rq.exceptions import NoSuchJobError
+from rq.registry import StartedJobRegistry, FailedJobRegistry
+
+from app.sampling import sampling_step
+
+# Kolejki w kolejności priorytetu: worker słuchający kilku kolejek bierze najpierw zadania z wcześniejszej
+QUEUE_CLASSES = ('short', 'long', 'bulk')
+# Nagrania z co najwyżej tyloma analizowanymi klatkami trafiają do kolejki short (10 min przy 30 kl./s)
+SHORT_MAX_FRAMES = int(os.getenv('SHORT_MAX_FRAMES', '18000'))
+# Limit czasu jednego przebiegu zadania (s); dla bulk - na każde nagranie w paczce
+QUEUE_TIMEOUTS = {
+    'short': int(os.getenv('SHORT_JOB_TIMEOUT', '1800')),
+    'long': int(os.getenv('LONG_JOB_TIMEOUT', '3600')),
+    'bulk': int(os.getenv('BULK_JOB_TIMEOUT', '900')),
+}
+# Liczba ponowień zadania po przekroczeniu limitu czasu lub przerwaniu workera - każde ponowienie wznawia analizę
+JOB_RETRIES = int(os.getenv('JOB_RETRIES', '3'))
+# Blokada, dzięki której przerwane zadania wznawia tylko jeden z uruchamianych jednocześnie workerów
+REQUEUE_LOCK = 'scheduling:requeue_lock'
+# Worker wykonujący zadanie odświeża heartbeat co DEFAULT_JOB_MONITORING_INTERVAL sekund - brak dwóch kolejnych
+# odświeżeń oznacza, że jego proces już nie żyje
+STALE_HEARTBEAT = 2 * DEFAULT_JOB_MONITORING_INTERVAL
+
+
+def probe_video(path):
+    """(liczba klatek, fps) z nagłówka pliku wideo; (0, 0.0), jeśli nie da się go odczytać."""
+    cap = cv2.VideoCapture(path)
+    try:
+        return max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0), cap.get(cv2.CAP_PROP_FPS) or 0.0
+    finally:
+        cap.release()
+
+
+def analysed_frames(frame_count, fps, frame_skip=0, sample_fps=None):
+    """Przewidywana liczba analizowanych klatek lub None, jeśli długość nagrania jest nieznana."""
+    if not frame_count: return None
+    return int(frame_count / sampling_step(frame_skip, sample_fps, fps))
+
+
+def choose_queue(frames):
+    """Kolejka pojedynczego nagrania: short dla krótkich analiz, long dla długich i o nieznanej długości (URL, YouTube)."""
+    return 'short' if frames is not None and frames <= SHORT_MAX_FRAMES else 'long'
+
+
+def enqueue_analysis(redis_conn, queue_name, func, *args, job_id, timeout=None):
+    """Zleca zadanie w kolejce danej klasy z limitem czasu klasy i ponowieniami.
+    job_id zadania RQ jest zapisywany w Job.rq_job_id - po nim worker odnajduje zadania do wznowienia."""
+    queue = Queue(queue_name, connection=redis_conn)
+    return queue.enqueue(func, *args, job_id=job_id, job_timeout=timeout or QUEUE_TIMEOUTS[queue_name],
+                         retry=Retry(max=JOB_RETRIES) if JOB_RETRIES else None)
+
+
+def current_queue_wait():
+    """(kolejka, czas oczekiwania w kolejce w sekundach) bieżącego zadania RQ lub (None, None) poza workerem."""
+    rq_job = get_current_job()
+    if rq_job is None or rq_job.enqueued_at is None: return None, None
+    return rq_job.origin, max((datetime.utcnow() - rq_job.enqueued_at).total_seconds(), 0.0)
+
+
+def will_retry(error):
+    """Czy bieżące zadanie należy oddać RQ do ponowienia po błędzie error. Ponawiamy tylko przekroczenie limitu
+    czasu (kolejny przebieg wznowi analizę od punktu kontrolnego) - błędy danych wejściowych (nieotwieralne wideo,
+    martwy URL, błąd yt-dlp) powtórzyłyby się w każdym przebiegu. Proces zabity w trakcie zadania RQ ponawia sam."""
+    rq_job = get_current_job()
+    return isinstance(error, JobTimeoutException) and rq_job is not None and bool(rq_job.retries_left)
+
+
+def running_job_ids(redis_conn):
+    """Identyfikatory zadań RQ wykonywanych teraz przez żyjące workery."""
+    return {worker.get_current_job_id() for worker in Worker.all(connection=redis_conn)} - {None}
+
+
+def _heartbeat_age(worker, now):
+    last_heartbeat = worker.last_heartbeat or worker.birth_date
+    return (now - last_heartbeat).total_seconds() if last_heartbeat else None
+
+
+def clean_stale_workers(redis_conn, since, poll_interval=5):
+    """Wyrejestrowuje workery wykonujące zadanie, których heartbeat jest starszy niż STALE_HEARTBEAT (ich wpisy
+    w Redis wygasłyby dopiero po kolejnej minucie). Żyjących workerów nie rusza, także z tą samą nazwą hosta
+    (sieć hosta, hostname w docker-compose).
+    Wpis z tego samego hosta, którego ostatni heartbeat poprzedza since (start bieżącego uruchomienia), mógł należeć
+    do poprzedniego uruchomienia kontenera - czekamy, aż heartbeat się odświeży albo przeterminuje.
+    Zwraca liczbę wyrejestrowanych workerów."""
+    hostname, removed = socket.gethostname(), 0
+    while True:
+        now, suspects = datetime.utcnow(), 0
+        for worker in Worker.all(connection=redis_conn):
+            age = _heartbeat_age(worker, now)
+            if worker.get_current_job_id() is None or age is None: continue
+            if age > STALE_HEARTBEAT:
+                worker.register_death()
+                removed += 1
+            elif worker.hostname == hostname and worker.last_heartbeat and worker.last_heartbeat < since:
+                suspects += 1
+        if not suspects: return removed
+        time.sleep(poll_interval)
+
+
+def requeue_interrupted_jobs(redis_conn, rq_job_ids):
+    """Ponownie kolejkuje zadania RQ o podanych id, których nie wykonuje żaden żyjący worker
+    (proces przerwany przez restart lub zabity przed obsłużeniem wyjątku). Zwraca id wznowionych zadań.
+    Martwe rejestracje workerów należy wcześniej usunąć przez clean_stale_workers."""
+    if not redis_conn.set(REQUEUE_LOCK, 1, nx=True, ex=60): return []
+    requeued = []
+    try:
+        running = running_job_ids(redis_conn)
+        for rq_job_id in set(rq_job_ids) - running:
+            try:
+                rq_job = QueueJob.fetch(rq_job_id, connection=redis_conn)
+            except NoSuchJobError:
+                continue
+            if rq_job.get_status() in ('queued', 'scheduled', 'deferred'): continue
+            queue = Queue(rq_job.origin, connection=redis_conn)
+            for registry in (StartedJobRegistry(queue=queue), FailedJobRegistry(queue=queue)): registry.remove(rq_job)
+            queue.enqueue_job(rq_job)
+            requeued.append(rq_job_id)
+    finally:
+        redis_conn.delete(REQUEUE_LOCK)
+    return requeued
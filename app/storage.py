@@ -0,0 +1,152 @@
+# app/storage.py
+# Buforowany zapis wyników analizy do bazy danych oraz strojenie SQLite.
+# Wyniki klatek są zapisywane w kolumnach liczbowych (x/y/z/hp/mana), wpisy battle listy w osobnej tabeli,
+# a szereg czasowy całego zadania dodatkowo jako spakowany artefakt NPZ (app/output/<job_id>_frames.npz).
+
+import os
+import time
+import sqlite3
+from array import array
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.hunt_areas import HuntAreaAccumulator, frame_durations
+
+# Liczba wyników klatek zapisywanych jednym executemany
+FRAME_BATCH_SIZE = int(os.getenv('FRAME_BATCH_SIZE', '1000'))
+# Katalog artefaktów z wynikami (ten sam co OUTPUT_FOLDER aplikacji WWW)
+RESULTS_FOLDER = os.path.join('app', 'output')
+# Kolumny artefaktu NPZ; brak pozycji zapisujemy jako -1
+ARTIFACT_COLUMNS = {'frame_number': 'i', 'timestamp': 'd', 'x': 'i', 'y': 'i', 'z': 'i', 'hp': 'f', 'mana': 'f'}
+# Ustawienia SQLite nakładane na każde nowe połączenie (WAL pozwala czytać stronie WWW w trakcie zapisu)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': '-65536',  # 64 MB
+    'busy_timeout': '5000',
+}
+
+
+@event.listens_for(Engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection): return
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def artifact_path(job_id, folder=RESULTS_FOLDER):
+    return os.path.join(folder, f"{job_id}_frames.npz")
+
+
+def save_frame_artifact(path, columns):
+    """Zapisuje kolumny szeregu czasowego zadania (słownik nazwa -> tablica) jako skompresowany NPZ."""
+    tmp_path = path + '.tmp.npz'
+    np.savez_compressed(tmp_path, **{name: np.asarray(values) for name, values in columns.items()})
+    os.replace(tmp_path, path)
+
+
+def load_frame_artifact(path):
+    """Wczytuje artefakt zadania jako słownik tablic NumPy lub None, jeśli nie istnieje."""
+    if not os.path.exists(path): return None
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def frame_row(job_id, frame_number, timestamp, analysis_result):
+    """Zamienia wynik analizy klatki na wiersz FrameData z kolumnami liczbowymi."""
+    coords = analysis_result.get('player_coords') or {}
+    stats = analysis_result.get('stats') or {}
+    return {
+        'job_id': job_id,
+        'frame_number': int(frame_number),
+        'timestamp': float(timestamp),
+        'x': int(coords['x']) if 'x' in coords else None,
+        'y': int(coords['y']) if 'y' in coords else None,
+        'z': int(coords['z']) if 'z' in coords else None,
+        'hp': float(stats['hp']) if stats.get('hp') is not None else None,
+        'mana': float(stats['mana']) if stats.get('mana') is not None else None,
+    }
+
+
+def battle_list_rows(job_id, frame_number, battle_list):
+    return [{'job_id': job_id, 'frame_number': int(frame_number), 'name': entity['name'],
+             'hp_percent': float(entity['hp_percent']), 'is_target': bool(entity['is_target'])}
+            for entity in battle_list or []]
+
+
+class FrameDataWriter:
+    """Gromadzi wyniki klatek i zapisuje je do bazy paczkami, niezależnie od aktualizacji postępu.
+    Równolegle zbiera kolumny szeregu czasowego, które close() zapisuje jako artefakt NPZ zadania,
+    i przy każdym zapisie paczki uzupełnia histogram obszarów polowania (hunt_areas).
+    Jeśli podano timer (app.metrics.StageTimer), zapisuje w nim czas zapisu każdej paczki (etap 'db_write').
+    on_flush(numer ostatniej klatki paczki) jest wywoływane przed zatwierdzeniem paczki - w tej samej transakcji
+    można zapisać punkt kontrolny zadania."""
+    def __init__(self, session, frame_model, battle_model, artifact=None, batch_size=FRAME_BATCH_SIZE, timer=None, on_flush=None):
+        self.session = session
+        self.frame_table = frame_model.__table__
+        self.battle_table = battle_model.__table__
+        self.artifact = artifact
+        self.batch_size = batch_size
+        self.frames, self.battle_entries = [], []
+        self.columns = {name: array(code) for name, code in ARTIFACT_COLUMNS.items()}
+        self.rows_written = 0
+        self.hunt_areas = HuntAreaAccumulator()
+        self.last_timestamp = None
+        self.timer = timer
+        self.on_flush = on_flush
+
+    def add(self, job_id, frame_number, timestamp, analysis_result):
+        row = frame_row(job_id, frame_number, timestamp, analysis_result)
+        self.frames.append(row)
+        self.battle_entries.extend(battle_list_rows(job_id, frame_number, analysis_result.get('battle_list')))
+        for name in self.columns:
+            value = row[name]
+            self.columns[name].append(-1 if value is None else value)
+        if len(self.frames) >= self.batch_size: self.flush()
+
+    def flush(self):
+        """Zapisuje bufor jednym executemany na tabelę i zatwierdza transakcję."""
+        if not self.frames: return
+        start = time.perf_counter()
+        self.session.execute(self.frame_table.insert(), self.frames)
+        if self.battle_entries: self.session.execute(self.battle_table.insert(), self.battle_entries)
+        if self.on_flush: self.on_flush(self.frames[-1]['frame_number'])
+        self.session.commit()
+        if self.timer: self.timer.record('db_write', time.perf_counter() - start)
+        self._update_hunt_areas()
+        self.rows_written += len(self.frames)
+        self.frames, self.battle_entries = [], []
+
+    def restore(self, rows):
+        """Wznowienie zadania: dołącza do kolumn i obszarów polowania wiersze zapisane wcześniej w bazie
+        (słowniki z kolumnami ARTIFACT_COLUMNS, w kolejności klatek), nie zapisując ich ponownie."""
+        if not rows: return
+        for row in rows:
+            for name in self.columns:
+                value = row[name]
+                self.columns[name].append(-1 if value is None else value)
+        self.frames = rows
+        self._update_hunt_areas()
+        self.frames = []
+
+    def _update_hunt_areas(self):
+        timestamps = [row['timestamp'] for row in self.frames]
+        durations = frame_durations(timestamps, self.last_timestamp)
+        self.last_timestamp = timestamps[-1]
+        known = [i for i, row in enumerate(self.frames) if row['x'] is not None and row['y'] is not None]
+        if known: self.hunt_areas.add([self.frames[i]['x'] for i in known], [self.frames[i]['y'] for i in known], durations[known])
+
+    def path_coords(self):
+        """Ścieżka gracza (N, 2) z zebranych kolumn - tylko klatki ze znaną pozycją."""
+        x, y = np.asarray(self.columns['x']), np.asarray(self.columns['y'])
+        valid = (x >= 0) & (y >= 0)
+        return np.column_stack((x[valid], y[valid]))
+
+    def close(self):
+        """Zapisuje resztę bufora oraz artefakt NPZ zadania."""
+        self.flush()
+        if self.artifact: save_frame_artifact(self.artifact, self.columns)
@@ -0,0 +1,60 @@
+# app/tiles.py
+# Piramida kafelków mapy świata (256x256 px) do wyświetlania mapy z przybliżeniem na stronie wyników.
+# Kafelki są cięte raz (np. przy budowaniu obrazu Docker) i serwowane jako pliki statyczne:
+# app/static/tiles/<zoom>/<x>/<y>.png, gdzie najwyższy zoom odpowiada 1 piksel = 1 kratka mapy.
+# Użycie: python -m app.tiles [map.png]
+
+import os
+import sys
+import json
+import math
+import cv2
+import numpy as np
+
+TILE_SIZE = 256
+TILES_FOLDER = os.path.join('app', 'static', 'tiles')
+
+
+def max_zoom(width, height, tile_size=TILE_SIZE):
+    """Poziom przybliżenia, na którym mapa ma natywną rozdzielczość (na poziomie 0 mieści się w jednym kafelku)."""
+    return max(math.ceil(math.log2(max(width, height) / tile_size)), 0)
+
+
+def load_tiles_meta(tiles_folder=TILES_FOLDER):
+    path = os.path.join(tiles_folder, 'meta.json')
+    if not os.path.exists(path): return None
+    with open(path) as f: return json.load(f)
+
+
+def build_tile_pyramid(world_map_path, tiles_folder=TILES_FOLDER, tile_size=TILE_SIZE):
+    """Tnie mapę na kafelki dla wszystkich poziomów przybliżenia. Zwraca metadane piramidy."""
+    level = cv2.imread(world_map_path)
+    if level is None: raise FileNotFoundError(f"Nie można wczytać mapy: {world_map_path}")
+    height, width = level.shape[:2]
+    top = max_zoom(width, height, tile_size)
+    for zoom in range(top, -1, -1):
+        level_h, level_w = level.shape[:2]
+        for tx in range(math.ceil(level_w / tile_size)):
+            os.makedirs(os.path.join(tiles_folder, str(zoom), str(tx)), exist_ok=True)
+            for ty in range(math.ceil(level_h / tile_size)):
+                # Kafelki brzegowe dopełniamy czernią do pełnego rozmiaru
+                tile = np.zeros((tile_size, tile_size, 3), dtype=np.uint8)
+                crop = level[ty * tile_size:(ty + 1) * tile_size, tx * tile_size:(tx + 1) * tile_size]
+                tile[:crop.shape[0], :crop.shape[1]] = crop
+                cv2.imwrite(os.path.join(tiles_folder, str(zoom), str(tx), f"{ty}.png"), tile)
+        level = cv2.resize(level, (max(level_w // 2, 1), max(level_h // 2, 1)), interpolation=cv2.INTER_AREA)
+    meta = {'width': width, 'height': height, 'max_zoom': top, 'tile_size': tile_size,
+            'map_mtime': os.path.getmtime(world_map_path)}
+    with open(os.path.join(tiles_folder, 'meta.json'), 'w') as f: json.dump(meta, f)
+    return meta
+
+
+if __name__ == '__main__':
+    map_path = sys.argv[1] if len(sys.argv) > 1 else 'map.png'
+    try:
+        meta = build_tile_pyramid(map_path)
+        print(f"Piramida kafelków gotowa: zoom 0-{meta['max_zoom']}, mapa {meta['width']}x{meta['height']}")
+    except FileNotFoundError as e:
+        # Brak mapy (np. pusty map.png przy pierwszej instalacji) nie może przerywać budowania obrazu
+        print(f"Pominięto budowę kafelków: {e}")
+    sys.exit(0)
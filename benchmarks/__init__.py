@@ -0,0 +1,3 @@
+# benchmarks/__init__.py
+# Skrypty pomiarowe (benchmarki) dla TibiaVision. Uruchamiane z katalogu głównego repozytorium,
+# np. python -m benchmarks.bench_position_search
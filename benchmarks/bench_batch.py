@@ -0,0 +1,125 @@
+# benchmarks/bench_batch.py
+# Analiza wielu krótkich nagrań: osobne zadanie run_analysis dla każdego klipu (jak przy osobnych zadaniach RQ
+# w jednym workerze z wczytanymi zasobami) vs. jedno zadanie run_batch_analysis (app.batch) dla wszystkich klipów.
+# Każdy tryb działa w osobnym, jednowątkowym procesie; mierzymy przepustowość na rdzeń (klatki na sekundę CPU),
+# czas, szczyt pamięci, liczbę wywołań OCR oraz dokładność względem ground truth (musi pozostać taka sama).
+# Tryb, którego proces zakończył się błędem, daje linię z polem "failed", a benchmark kończy się kodem 1.
+# Użycie: python -m benchmarks.bench_batch [--clips 50] [--frames 150] [--ocr auto] [--lanes 8] [--batch-frames 64]
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from contextlib import redirect_stdout
+import cv2
+import numpy as np
+
+from benchmarks.synthetic import load_world_map, write_session_video
+from benchmarks.bench_pipeline import make_ocr_reader, accuracy, git_commit, run_in_process
+
+
+class CountingReader:
+    """Liczy wywołania recognizera i rozpoznawane wiersze (wspólny cache OCR w trybie wsadowym zmniejsza obie liczby)."""
+    def __init__(self, reader):
+        self.reader = reader
+        self.calls = 0
+        self.rows = 0
+
+    def recognize(self, image, horizontal_list=None, free_list=None, **kwargs):
+        self.calls += 1
+        self.rows += len(horizontal_list or [])
+        return self.reader.recognize(image, horizontal_list=horizontal_list, free_list=free_list, **kwargs)
+
+
+def run_mode(mode, db_path, clips, args, queue):
+    """Proces potomny: wszystkie klipy w trybie 'per_job' albo 'batch'."""
+    from app import analysis
+    from app.resources import get_shared_resources
+    analysis.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    analysis.BATCH_LANES, analysis.BATCH_FRAMES = args.lanes, args.batch_frames
+    multiprocessing.set_start_method('fork', force=True)
+    reader, ocr = make_ocr_reader(args.ocr)
+    reader = CountingReader(reader)
+    # Zasoby wczytuje worker przed pierwszym zadaniem (PRELOAD_RESOURCES) - nie wliczamy ich do pomiaru
+    get_shared_resources('map.png', 'en', ocr_reader=reader)
+    with analysis.app.app_context():
+        analysis.db.create_all()
+        analysis.db.session.add_all([analysis.Job(id=job_id, user_id='bench') for job_id, _ in clips])
+        analysis.db.session.commit()
+    with redirect_stdout(sys.stderr):
+        start, cpu_start = time.perf_counter(), time.process_time()
+        if mode == 'batch':
+            analysis.run_batch_analysis([job_id for job_id, _ in clips], [path for _, path in clips], args.frame_skip)
+        else:
+            for job_id, path in clips:
+                analysis.run_analysis(job_id, 'upload', os.path.basename(path), args.frame_skip, path)
+        wall, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+    queue.put({'ocr': ocr, 'wall_s': wall, 'cpu_s': cpu, 'ocr_calls': reader.calls, 'ocr_rows': reader.rows,
+               'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024})
+
+
+def summarize(db_path, clips, truths):
+    """Łączna liczba klatek, statusy zadań i średnia dokładność po klipach."""
+    con = sqlite3.connect(db_path)
+    statuses = [con.execute("SELECT status FROM job WHERE id = ?", (job_id,)).fetchone()[0] for job_id, _ in clips]
+    con.close()
+    per_clip = [accuracy(db_path, job_id, truth) for (job_id, _), truth in zip(clips, truths)]
+    mean = {key: float(np.mean([a[key] for a in per_clip if a[key] is not None]))
+            for key in per_clip[0] if key != 'frames_analysed' and any(a[key] is not None for a in per_clip)}
+    return sum(a['frames_analysed'] for a in per_clip), statuses.count('completed'), mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark analizy wsadowej wielu klipów vs. osobnych zadań")
+    parser.add_argument('--map', default='map.png')
+    parser.add_argument('--clips', type=int, default=50)
+    parser.add_argument('--frames', type=int, default=150, help="Długość klipu w klatkach (30 kl./s)")
+    parser.add_argument('--frame-skip', type=int, default=0)
+    parser.add_argument('--ocr', choices=['auto', 'easyocr', 'template'], default='auto')
+    parser.add_argument('--lanes', type=int, default=8, help="BATCH_LANES - nagrania analizowane jednocześnie")
+    parser.add_argument('--batch-frames', type=int, default=64, help="BATCH_FRAMES - klatki w jednej paczce")
+    args = parser.parse_args()
+
+    world_map = load_world_map(args.map)
+    commit, cwd = git_commit(), os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for folder in ('app/uploads', 'app/output'): os.makedirs(folder)
+            cv2.imwrite('map.png', world_map)
+            clips, truths = [], []
+            for i in range(args.clips):
+                path = os.path.join('app', 'uploads', f'clip_{i}.mp4')
+                truths.append(write_session_video(path, world_map, args.frames, seed=i))
+                clips.append((f'clip-{i}', path))
+            context = multiprocessing.get_context('spawn')
+            results = {}
+            for mode in ('per_job', 'batch'):
+                db_path = os.path.join(tmp, f'{mode}.db')
+                for name in os.listdir(os.path.join('app', 'output')): os.remove(os.path.join('app', 'output', name))
+                run, error = run_in_process(context, run_mode, mode, db_path, clips, args)
+                if error:
+                    print(json.dumps({"benchmark": "batch", "mode": mode, "commit": commit, "clips": args.clips, "failed": error}), flush=True)
+                    return 1
+                frames, completed, mean_accuracy = summarize(db_path, clips, truths)
+                results[mode] = {"benchmark": "batch", "mode": mode, "commit": commit, "clips": args.clips, "completed": completed,
+                                 "frames_per_clip": args.frames, "frames_analysed": frames, **run,
+                                 "frames_per_s": frames / run['wall_s'], "frames_per_cpu_s": frames / run['cpu_s'],
+                                 "lanes": args.lanes, "batch_frames": args.batch_frames, "accuracy": mean_accuracy}
+                print(json.dumps(results[mode]), flush=True)
+            print(json.dumps({"benchmark": "batch", "mode": "comparison",
+                              "speedup_per_core": results['batch']['frames_per_cpu_s'] / results['per_job']['frames_per_cpu_s'],
+                              "speedup_wall": results['per_job']['wall_s'] / results['batch']['wall_s'],
+                              "ocr_calls_ratio": results['batch']['ocr_calls'] / max(results['per_job']['ocr_calls'], 1)}))
+        finally:
+            os.chdir(cwd)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
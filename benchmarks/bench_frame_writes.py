@@ -0,0 +1,76 @@
+# benchmarks/bench_frame_writes.py
+# Porównanie zapisu wyników klatek: ORM add() + commit co 50 klatek vs. FrameDataWriter (executemany + WAL).
+# Użycie: python -m benchmarks.bench_frame_writes [--frames 100000]
+
+import os
+import json
+import time
+import argparse
+import tempfile
+from flask import Flask
+
+from app import storage
+from app.main import db, Job, FrameData, BattleListEntry
+
+SAMPLE_RESULT = {"player_coords": {"x": 1024, "y": 768, "z": 7}, "stats": {"hp": 87.5, "mana": 42.0},
+                 "battle_list": [{"name": "Rotworm", "hp_percent": 100.0, "is_target": False}]}
+
+
+def make_app(db_path):
+    bench_app = Flask(__name__)
+    bench_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    bench_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(bench_app)
+    return bench_app
+
+
+def old_path(job, frames):
+    for frame_number in range(frames):
+        db.session.add(FrameData(job_id=job.id, frame_number=frame_number, timestamp=frame_number / 30.0,
+                                 player_coords_json=json.dumps(SAMPLE_RESULT['player_coords']),
+                                 stats_json=json.dumps(SAMPLE_RESULT['stats']),
+                                 battle_list_json=json.dumps(SAMPLE_RESULT['battle_list'])))
+        if frame_number % 50 == 0:
+            job.progress = int(frame_number / frames * 100)
+            db.session.commit()
+    db.session.commit()
+
+
+def new_path(job, frames):
+    writer = storage.FrameDataWriter(db.session, FrameData, BattleListEntry)
+    for frame_number in range(frames):
+        writer.add(job.id, frame_number, frame_number / 30.0, SAMPLE_RESULT)
+    writer.flush()
+
+
+def run(name, path, db_path, frames, tuned):
+    pragmas = dict(storage.SQLITE_PRAGMAS)
+    if not tuned: storage.SQLITE_PRAGMAS.clear()
+    try:
+        with make_app(db_path).app_context():
+            db.create_all()
+            job = Job(id=name)
+            db.session.add(job)
+            db.session.commit()
+            start = time.perf_counter()
+            path(job, frames)
+            elapsed = time.perf_counter() - start
+            count = FrameData.query.filter_by(job_id=name).count()
+            db.session.remove()
+            db.get_engine().dispose()
+    finally:
+        storage.SQLITE_PRAGMAS.update(pragmas)
+    return {"path": name, "frames": count, "seconds": elapsed, "frames_per_s": count / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark zapisu wyników klatek do SQLite")
+    parser.add_argument('--frames', type=int, default=100000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        print(json.dumps(run('orm_add_commit_every_50', old_path, os.path.join(tmp, 'old.db'), args.frames, tuned=False)))
+        print(json.dumps(run('bulk_writer_wal', new_path, os.path.join(tmp, 'new.db'), args.frames, tuned=True)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# benchmarks/bench_hunt_areas.py
+# Porównanie wyznaczania obszarów polowania: DBSCAN(eps=50, min_samples=20) na wszystkich punktach
+# (dawna implementacja, tylko największy klaster) vs. histogram na siatce (app.hunt_areas).
+# Użycie: python -m benchmarks.bench_hunt_areas [--sizes 10000 100000 1000000] [--dbscan-max 40000]
+# DBSCAN wymaga scikit-learn. Jego czas i pamięć są proporcjonalne do liczby par punktów odległych o co najwyżej eps
+# (scikit-learn trzyma indeksy sąsiadów każdego punktu), a obszary polowania są odwiedzane wielokrotnie, więc par
+# przybywa z kwadratem długości sesji. Dla sesji większych niż --dbscan-max liczymy dokładną liczbę par (histogram
+# pozycji splatany z kołem o promieniu eps) i ekstrapolujemy czas i pamięć DBSCAN prostą dopasowaną do pomiarów
+# kalibracyjnych (--dbscan-max/4, /2 i --dbscan-max punktów); wynik ma pole "extrapolated": true.
+# Każdy pomiar działa w świeżym procesie - peak_rss_mb obejmuje też pamięć spoza interpretera (np. scikit-learn).
+# Pomiar, którego proces zakończył się błędem (wyjątek, OOM), daje linię z polem "failed", a benchmark kończy się kodem 1.
+
+import sys
+import json
+import time
+import argparse
+import resource
+import tracemalloc
+import multiprocessing
+import cv2
+import numpy as np
+
+from app.hunt_areas import HuntAreaAccumulator, find_hunt_areas
+from benchmarks.bench_pipeline import run_in_process
+
+# Promień sąsiedztwa dawnej implementacji DBSCAN
+DBSCAN_EPS = 50
+
+
+def hunting_session(points, hunts=5, fps=1.0, speed=4, seed=0):
+    """Syntetyczna sesja: przejście do obszaru polowania (speed sqm na próbkę), krążenie po nim, przejście do następnego itd.
+    Obszary są odwiedzane w kółko, więc trasy między nimi są wielokrotnie przechodzone.
+    Zwraca (coords (N, 2), timestamps (N,), środki obszarów polowania)."""
+    rng = np.random.default_rng(seed)
+    centres = rng.integers(300, 2200, size=(hunts, 2))
+    coords, position, hunt = [], centres[0].astype(np.float64), 0
+    while sum(len(c) for c in coords) < points:
+        target = centres[hunt % hunts]
+        # Przejście w linii prostej
+        steps = max(int(np.abs(target - position).max()) // speed, 1)
+        coords.append(np.linspace(position, target, steps, endpoint=False))
+        # Polowanie: ograniczone błądzenie losowe wokół środka obszaru
+        walk = np.cumsum(rng.integers(-1, 2, size=(int(rng.integers(2000, 20000)), 2)), axis=0)
+        coords.append(target + np.clip(walk, -60, 60))
+        position, hunt = coords[-1][-1], hunt + 1
+    coords = np.vstack(coords)[:points].astype(np.int32)
+    return coords, np.arange(len(coords)) / fps, centres
+
+
+def neighbour_pairs(coords, eps=DBSCAN_EPS):
+    """Liczba uporządkowanych par punktów (łącznie z parą punktu z samym sobą) odległych o co najwyżej eps -
+    tyle indeksów sąsiadów zapisuje DBSCAN ze scikit-learn."""
+    x, y = (coords - coords.min(axis=0)).T
+    w, h = int(x.max()) + 1, int(y.max()) + 1
+    hist = np.bincount(y.astype(np.int64) * w + x, minlength=w * h).reshape(h, w).astype(np.float32)
+    r = np.arange(-eps, eps + 1)
+    disc = ((r[:, None] ** 2 + r[None, :] ** 2) <= eps * eps).astype(np.float32)
+    neighbours = cv2.filter2D(hist, -1, disc, borderType=cv2.BORDER_CONSTANT)
+    return int(np.rint((hist.astype(np.float64) * neighbours).sum()))
+
+
+def dbscan_largest_area(coords):
+    """Dawna implementacja: prostokąt otaczający największy klaster DBSCAN."""
+    from sklearn.cluster import DBSCAN
+    labels = DBSCAN(eps=DBSCAN_EPS, min_samples=20).fit(coords).labels_
+    clusters = labels[labels >= 0]
+    if not len(clusters): return []
+    cluster_points = coords[labels == np.bincount(clusters).argmax()]
+    (x0, y0), (x1, y1) = cluster_points.min(axis=0), cluster_points.max(axis=0)
+    return [{'x': int(x0), 'y': int(y0), 'w': int(x1 - x0 + 1), 'h': int(y1 - y0 + 1)}]
+
+
+def incremental_areas(coords, timestamps, batch_size=1000):
+    """Histogram uzupełniany paczkami, tak jak robi to FrameDataWriter w trakcie analizy."""
+    accumulator = HuntAreaAccumulator()
+    durations = np.diff(timestamps, prepend=timestamps[0])
+    for start in range(0, len(coords), batch_size):
+        batch = slice(start, start + batch_size)
+        accumulator.add(coords[batch, 0], coords[batch, 1], durations[batch])
+    return accumulator.areas()
+
+
+METHODS = {
+    'grid_histogram': lambda coords, timestamps: find_hunt_areas(coords, timestamps),
+    'grid_histogram_incremental': incremental_areas,
+    'dbscan_largest_cluster': lambda coords, timestamps: dbscan_largest_area(coords),
+}
+
+
+def run_method(name, points, hunts, queue):
+    """Proces pomiaru: sesja jest generowana na miejscu, rss_delta_mb to przyrost szczytowego RSS w trakcie metody."""
+    coords, timestamps, centres = hunting_session(points, hunts)
+    # Pierwsze wywołanie importuje scikit-learn - robimy je na małej próbce poza pomiarem
+    if name == 'dbscan_largest_cluster': dbscan_largest_area(coords[:100])
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    start = time.perf_counter()
+    areas = METHODS[name](coords, timestamps)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    found = sum(any(a['x'] <= cx < a['x'] + a['w'] and a['y'] <= cy < a['y'] + a['h'] for a in areas) for cx, cy in centres)
+    result = {"method": name, "points": points, "seconds": elapsed, "peak_mb": peak / 2**20,
+              "peak_rss_mb": rss_after / 1024, "rss_delta_mb": (rss_after - rss_before) / 1024,
+              "areas": len(areas), "hunts_found": int(found), "hunts_total": len(centres)}
+    if name == 'dbscan_largest_cluster': result['neighbour_pairs'] = neighbour_pairs(coords)
+    queue.put(result)
+
+
+def measure(context, name, points, hunts):
+    """Uruchamia pomiar w świeżym procesie. Proces zakończony błędem (np. zabity przez OOM) daje wynik z polem "failed"."""
+    result, error = run_in_process(context, run_method, name, points, hunts)
+    return {"method": name, "points": points, "failed": error} if error else result
+
+
+def extrapolate(runs, points, hunts):
+    """Ekstrapolacja czasu i przyrostu pamięci DBSCAN do sesji points punktów z dopasowania y = a + b * liczba par
+    do pomiarów runs. neighbour_index_mb to sama pamięć indeksów sąsiadów (int64) - dolne ograniczenie."""
+    pairs = neighbour_pairs(hunting_session(points, hunts)[0])
+    result = {"method": "dbscan_largest_cluster", "points": points, "extrapolated": True,
+              "fit_points": [run['points'] for run in runs], "neighbour_pairs": pairs, "neighbour_index_mb": pairs * 8 / 2**20}
+    for key in ('seconds', 'rss_delta_mb'):
+        slope, offset = np.polyfit([run['neighbour_pairs'] for run in runs], [run[key] for run in runs], 1)
+        result[key] = float(offset + slope * pairs)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark wyznaczania obszarów polowania")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--dbscan-max', type=int, default=40000,
+                        help="Największa sesja, dla której uruchamiamy DBSCAN; większe są ekstrapolowane")
+    parser.add_argument('--hunts', type=int, default=5)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    calibration = sorted({max(args.dbscan_max // 4, 1), max(args.dbscan_max // 2, 1), args.dbscan_max})
+    dbscan_runs, failed = {}, []
+
+    def report(result, **extra):
+        if 'failed' in result: failed.append(result)
+        print(json.dumps({**result, **extra}), flush=True)
+        return result
+
+    def run_dbscan(points, **extra):
+        if points not in dbscan_runs:
+            dbscan_runs[points] = report(measure(context, 'dbscan_largest_cluster', points, args.hunts), **extra)
+        return dbscan_runs[points]
+
+    for points in args.sizes:
+        for name in ('grid_histogram', 'grid_histogram_incremental'):
+            report(measure(context, name, points, args.hunts))
+        if points <= args.dbscan_max:
+            run_dbscan(points)
+            continue
+        runs = [run_dbscan(size, calibration=True) for size in calibration]
+        runs = [run for run in runs if 'failed' not in run]
+        if len(runs) < 2:
+            report({"method": "dbscan_largest_cluster", "points": points, "failed": "za mało pomiarów kalibracyjnych"})
+        else:
+            report(extrapolate(runs, points, args.hunts))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
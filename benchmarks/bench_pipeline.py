@@ -0,0 +1,197 @@
+# benchmarks/bench_pipeline.py
+# Benchmark całego potoku analizy (run_analysis: dekodowanie, analiza klatek, zapis do bazy, obszary polowania,
+# wizualizacja) na syntetycznym nagraniu z map.png: minimapa przesuwa się po mapie, battle lista i paski HP/many
+# mają znane wartości (benchmarks.synthetic.write_session_video).
+# Działa offline na CPU. OCR: EasyOCR z lokalnie pobranymi modelami, a jeśli ich brak - dopasowanie wzorców nazw
+# (--ocr template), które mierzy narzut potoku bez kosztu modelu.
+# Każdy przebieg działa w osobnym procesie; wynik to jedna linia JSON z przepustowością, czasami etapów (p50/p95),
+# szczytem pamięci (RSS procesu analizy) i dokładnością pozycji, HP/many i battle listy względem ground truth.
+# Przebieg, którego proces zakończył się błędem, daje linię z polem "failed", a benchmark kończy się kodem 1.
+# Użycie: python -m benchmarks.bench_pipeline [--frames 1800] [--frame-skip 0] [--workers 1 2] [--ocr auto] > wyniki.jsonl
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import resource
+import tempfile
+import subprocess
+import queue as queue_module
+import multiprocessing
+from contextlib import redirect_stdout
+from collections import defaultdict
+import cv2
+import numpy as np
+
+from benchmarks.synthetic import load_world_map, write_session_video, TemplateNameReader
+
+VIDEO_FILENAME = 'bench.mp4'
+
+
+def make_ocr_reader(mode):
+    """EasyOCR bez pobierania modeli (offline) albo TemplateNameReader. Zwraca (reader, nazwa użytego OCR)."""
+    if mode != 'template':
+        try:
+            import easyocr
+            return easyocr.Reader(['en'], gpu=False, download_enabled=False, verbose=False), 'easyocr'
+        except Exception as e:
+            if mode == 'easyocr': raise
+            print(f"EasyOCR niedostępny offline ({e}) - używam dopasowania wzorców nazw", file=sys.stderr)
+    return TemplateNameReader(), 'template'
+
+
+def run_job(db_path, job_id, frame_skip, workers, segment_min_frames, ocr_mode, queue):
+    """Proces potomny: jedno zadanie run_analysis na nagraniu z bieżącego katalogu."""
+    from app import analysis
+    from app.resources import get_shared_resources
+    analysis.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    analysis.ANALYSIS_WORKERS = workers
+    if segment_min_frames: analysis.SEGMENT_MIN_FRAMES = segment_min_frames
+    # Proces uruchomiony przez spawn dziedziczy tę metodę; pula segmentów, tak jak w workerze, ma użyć fork()
+    # i odziedziczyć wczytane zasoby (w tym wybrany OCR)
+    multiprocessing.set_start_method('fork', force=True)
+    reader, ocr = make_ocr_reader(ocr_mode)
+    start = time.perf_counter()
+    get_shared_resources('map.png', 'en', ocr_reader=reader)
+    resources_s = time.perf_counter() - start
+    with analysis.app.app_context():
+        analysis.db.create_all()
+        analysis.db.session.add(analysis.Job(id=job_id, user_id='bench'))
+        analysis.db.session.commit()
+    # Komunikaty potoku (np. brak Redis) idą na stderr, żeby stdout zawierał tylko JSON
+    with redirect_stdout(sys.stderr):
+        start = time.perf_counter()
+        analysis.run_analysis(job_id, 'upload', VIDEO_FILENAME, frame_skip, os.path.join('app', 'uploads', VIDEO_FILENAME))
+        wall = time.perf_counter() - start
+    # ru_maxrss jest w KB (Linux); procesy segmentów liczymy osobno
+    queue.put({'ocr': ocr, 'resources_s': resources_s, 'wall_s': wall,
+               'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+               'peak_rss_segment_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024})
+
+
+def run_in_process(context, target, *args):
+    """Uruchamia target(*args, queue) w osobnym procesie. Zwraca (wynik z kolejki, None) albo (None, opis błędu),
+    jeśli proces zakończył się bez wyniku (wyjątek - traceback trafia na stderr - lub zabicie, np. przez OOM)."""
+    results = context.Queue()
+    process = context.Process(target=target, args=(*args, results))
+    process.start()
+    result = None
+    while result is None:
+        try:
+            result = results.get(timeout=1)
+        except queue_module.Empty:
+            if process.is_alive(): continue
+            # Proces mógł zakończyć się tuż po wysłaniu wyniku
+            try:
+                result = results.get_nowait()
+            except queue_module.Empty:
+                break
+    process.join()
+    if result is None or process.exitcode != 0: return None, f"exit code {process.exitcode}"
+    return result, None
+
+
+def accuracy(db_path, job_id, truth):
+    """Porównanie wyników zapisanych w bazie z ground truth klatek."""
+    con = sqlite3.connect(db_path)
+    frames = con.execute("SELECT frame_number, x, y, hp, mana FROM frame_data WHERE job_id = ? ORDER BY frame_number", (job_id,)).fetchall()
+    battle = defaultdict(list)
+    for frame_number, name, hp_percent, is_target in con.execute(
+            "SELECT frame_number, name, hp_percent, is_target FROM battle_list_entry WHERE job_id = ? ORDER BY id", (job_id,)):
+        battle[frame_number].append((name, hp_percent, bool(is_target)))
+    con.close()
+    position_errors, hp_errors, mana_errors = [], [], []
+    names_total = names_correct = targets_correct = extra_rows = 0
+    creature_hp_errors = []
+    for frame_number, x, y, hp, mana in frames:
+        expected = truth[frame_number]
+        if x is not None: position_errors.append(np.hypot(x - expected['x'], y - expected['y']))
+        if hp is not None: hp_errors.append(abs(hp - expected['hp']))
+        if mana is not None: mana_errors.append(abs(mana - expected['mana']))
+        found = battle.get(frame_number, [])
+        names_total += len(expected['creatures'])
+        extra_rows += max(len(found) - len(expected['creatures']), 0)
+        for (name, creature_hp, target), (found_name, found_hp, found_target) in zip(expected['creatures'], found):
+            names_correct += name == found_name
+            targets_correct += target == found_target
+            creature_hp_errors.append(abs(creature_hp - found_hp))
+    position_errors = np.asarray(position_errors)
+    analysed = len(frames)
+    return {
+        'frames_analysed': analysed,
+        'position_coverage': len(position_errors) / analysed if analysed else 0.0,
+        'position_error_mean': float(position_errors.mean()) if len(position_errors) else None,
+        'position_error_p95': float(np.percentile(position_errors, 95)) if len(position_errors) else None,
+        'position_within_2sqm': float((position_errors <= 2).mean()) if len(position_errors) else 0.0,
+        'hp_mae': float(np.mean(hp_errors)) if hp_errors else None,
+        'mana_mae': float(np.mean(mana_errors)) if mana_errors else None,
+        'battle_names_accuracy': names_correct / names_total if names_total else None,
+        'battle_targets_accuracy': targets_correct / names_total if names_total else None,
+        'battle_hp_mae': float(np.mean(creature_hp_errors)) if creature_hp_errors else None,
+        'battle_extra_rows': extra_rows,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark całego potoku analizy na syntetycznym nagraniu z ground truth")
+    parser.add_argument('--map', default='map.png')
+    parser.add_argument('--frames', type=int, default=1800, help="Długość nagrania w klatkach (30 kl./s)")
+    parser.add_argument('--frame-skip', type=int, default=0)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1], help="Wartości ANALYSIS_WORKERS do porównania")
+    parser.add_argument('--segment-min-frames', type=int, help="SEGMENT_MIN_FRAMES dla krótkich nagrań w trybie segmentowym")
+    parser.add_argument('--ocr', choices=['auto', 'easyocr', 'template'], default='auto')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    world_map = load_world_map(args.map, args.seed)
+    commit, cwd = git_commit(), os.getcwd()
+    # Potok używa ścieżek względnych (map.png, app/uploads, app/output) - pracujemy w katalogu tymczasowym
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for folder in ('app/uploads', 'app/output'): os.makedirs(folder)
+            cv2.imwrite('map.png', world_map)
+            start = time.perf_counter()
+            truth = write_session_video(os.path.join('app', 'uploads', VIDEO_FILENAME), world_map, args.frames, seed=args.seed)
+            synth_s = time.perf_counter() - start
+            # Świeży interpreter na każdy przebieg: pomiar pamięci i czasu nie zależy od poprzednich przebiegów
+            context = multiprocessing.get_context('spawn')
+            failed = False
+            for workers in args.workers:
+                db_path, job_id = os.path.join(tmp, f'bench_{workers}.db'), f'bench-{workers}'
+                # Wizualizacje są adresowane treścią - bez czyszczenia kolejny przebieg wziąłby je z cache
+                for name in os.listdir(os.path.join('app', 'output')): os.remove(os.path.join('app', 'output', name))
+                run, error = run_in_process(context, run_job, db_path, job_id, args.frame_skip, workers, args.segment_min_frames, args.ocr)
+                if error:
+                    print(json.dumps({"benchmark": "pipeline", "commit": commit, "frames": args.frames, "workers": workers, "failed": error}), flush=True)
+                    failed = True
+                    continue
+                con = sqlite3.connect(db_path)
+                status, metrics_json = con.execute("SELECT status, metrics_json FROM job WHERE id = ?", (job_id,)).fetchone()
+                con.close()
+                metrics = json.loads(metrics_json) if metrics_json else {}
+                result = {"benchmark": "pipeline", "commit": commit, "frames": args.frames, "frame_skip": args.frame_skip,
+                          "workers": workers, "cpu_count": os.cpu_count(), "synthesis_s": synth_s, "status": status, **run,
+                          "frames_per_s": metrics.get('frames_per_s'), "relocalisations": metrics.get('relocalisations', 0),
+                          "tracking_loss_rate": metrics.get('tracking_loss_rate'),
+                          "stages": {name: {key: stage[key] for key in ('count', 'p50_ms', 'p95_ms', 'total_s')}
+                                     for name, stage in metrics.get('stages', {}).items()},
+                          "accuracy": accuracy(db_path, job_id, truth)}
+                print(json.dumps(result), flush=True)
+        finally:
+            os.chdir(cwd)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+# benchmarks/bench_position_search.py
+# Porównanie relokalizacji: pełny matchTemplate po mapie świata vs. WorldMapIndex.
+# Użycie: python -m benchmarks.bench_position_search [--map map.png] [--samples 50]
+
+import os
+import cv2
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from app.map_index import WorldMapIndex
+from benchmarks.synthetic import load_world_map, random_crops
+
+
+def full_search(world_map_gray, crop):
+    result = cv2.matchTemplate(world_map_gray, crop, cv2.TM_CCOEFF_NORMED)
+    _, max_val, _, max_loc = cv2.minMaxLoc(result)
+    return (max_loc[0], max_loc[1], max_val)
+
+
+def measure(name, search, crops):
+    latencies, hits = [], 0
+    for crop, x, y in crops:
+        start = time.perf_counter()
+        match = search(crop)
+        latencies.append(time.perf_counter() - start)
+        if match and match[2] >= 0.7 and abs(match[0] - x) <= 1 and abs(match[1] - y) <= 1: hits += 1
+    return {"method": name, "samples": len(crops), "accuracy": hits / len(crops),
+            "p50_ms": float(np.percentile(latencies, 50) * 1000), "p95_ms": float(np.percentile(latencies, 95) * 1000)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark relokalizacji pozycji na mapie świata")
+    parser.add_argument('--map', default='map.png')
+    parser.add_argument('--samples', type=int, default=50)
+    parser.add_argument('--noise', type=float, default=4.0, help="Odchylenie szumu dodawanego do wycinków")
+    args = parser.parse_args()
+
+    world_map_gray = cv2.cvtColor(load_world_map(args.map), cv2.COLOR_BGR2GRAY)
+    crops = random_crops(world_map_gray, args.samples, noise=args.noise)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        map_path = os.path.join(tmp, 'map.png')
+        cv2.imwrite(map_path, world_map_gray)
+        start = time.perf_counter()
+        index = WorldMapIndex.load_or_build(map_path, world_map_gray)
+        build_s = time.perf_counter() - start
+        start = time.perf_counter()
+        WorldMapIndex.load_or_build(map_path, world_map_gray)
+        load_s = time.perf_counter() - start
+
+    print(json.dumps({"map_shape": list(world_map_gray.shape), "index_build_s": build_s, "index_load_s": load_s}))
+    print(json.dumps(measure("full_match_template", lambda c: full_search(world_map_gray, c), crops)))
+    print(json.dumps(measure("world_map_index", index.locate, crops)))
+
+
+if __name__ == '__main__':
+    main()
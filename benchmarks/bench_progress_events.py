@@ -0,0 +1,135 @@
+# benchmarks/bench_progress_events.py
+# Test obciążeniowy śledzenia postępu: odpytywanie /status/<job_id> co 3 s przez każdą kartę panelu
+# (worker zapisuje postęp do bazy co 2 s) vs. jeden strumień SSE /events na kartę
+# (worker publikuje postęp w Redis co 1 s, a do bazy zapisuje go co PROGRESS_DB_INTERVAL sekund).
+# Mierzy liczbę żądań HTTP na sekundę i zapytań SQL po stronie WWW i workera.
+# Wymaga działającego serwera Redis (REDIS_URL, domyślnie redis://localhost:6379) albo, z --fakeredis,
+# pakietu fakeredis (Redis w pamięci procesu - bez serwera, ale też bez kosztu sieci).
+# Użycie: python -m benchmarks.bench_progress_events [--jobs 100] [--tabs 3] [--duration 30] [--fakeredis]
+
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+from collections import Counter
+
+os.environ.setdefault('REDIS_URL', 'redis://localhost:6379')
+os.environ.setdefault('SSE_KEEPALIVE', '1')
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import main as web
+from app.main import app, db, Job, redis_conn
+from app.progress import ProgressPublisher, state_key
+
+POLL_INTERVAL = 3.0
+OLD_DB_INTERVAL = 2.0
+PUBLISH_INTERVAL = 1.0
+DB_INTERVAL = 30.0
+
+# Zapytania SQL liczone osobno dla wątków "web-*" (strona WWW) i "worker" (symulowane zadania)
+queries = Counter()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    queries[threading.current_thread().name.split('-')[0]] += 1
+
+
+def logged_in_client():
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'password'})
+    return client
+
+
+def simulate_workers(job_ids, duration, publish, db_interval):
+    """Jeden wątek udaje wszystkie zadania: co sekundę zwiększa postęp, publikuje go (SSE) i co db_interval zapisuje do bazy."""
+    publishers = [ProgressPublisher(redis_conn, job_id, 'admin') for job_id in job_ids]
+    start = last_db = time.monotonic()
+    while time.monotonic() - start < duration:
+        elapsed = time.monotonic() - start
+        progress = min(int(elapsed / duration * 100), 99)
+        if publish:
+            for publisher in publishers: publisher.publish('processing', progress, int(elapsed * 30))
+        if time.monotonic() - last_db >= db_interval:
+            with app.app_context():
+                # Każde zadanie to osobny worker, więc osobny UPDATE i commit
+                for job_id in job_ids:
+                    Job.query.filter_by(id=job_id).update({'progress': progress, 'frames_processed': int(elapsed * 30)})
+                    db.session.commit()
+            last_db = time.monotonic()
+        time.sleep(PUBLISH_INTERVAL if publish else db_interval)
+
+
+def polling_tab(job_ids, duration, stats):
+    client = logged_in_client()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        round_start = time.monotonic()
+        for job_id in job_ids:
+            client.get(f'/status/{job_id}')
+            stats['requests'] += 1
+        time.sleep(max(POLL_INTERVAL - (time.monotonic() - round_start), 0))
+
+
+def sse_tab(duration, stats):
+    client = logged_in_client()
+    deadline = time.monotonic() + duration
+    response = client.get('/events', buffered=False)
+    stats['requests'] += 1
+    for chunk in response.response:
+        stats['events'] += chunk.count(b'data: ' if isinstance(chunk, bytes) else 'data: ')
+        if time.monotonic() >= deadline: break
+    response.close()
+
+
+def run(mode, job_ids, tabs, duration):
+    # Stan w Redis zostawiony przez inny tryb zafałszowałby ścieżkę /status
+    redis_conn.delete(*[state_key(job_id) for job_id in job_ids])
+    queries.clear()
+    stats = Counter()
+    threads = [threading.Thread(target=simulate_workers, name='worker', args=(job_ids, duration, mode == 'sse', DB_INTERVAL if mode == 'sse' else OLD_DB_INTERVAL))]
+    for i in range(tabs):
+        target, args = (sse_tab, (duration, stats)) if mode == 'sse' else (polling_tab, (job_ids, duration, stats))
+        threads.append(threading.Thread(target=target, name=f'web-{i}', args=args))
+    start = time.perf_counter()
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    elapsed = time.perf_counter() - start
+    return {"mode": mode, "jobs": len(job_ids), "tabs": tabs, "duration_s": elapsed, "http_requests": stats['requests'],
+            "requests_per_s": stats['requests'] / elapsed, "web_db_queries": queries['web'], "web_db_queries_per_s": queries['web'] / elapsed,
+            "worker_db_queries": queries['worker'], "events_delivered": stats['events']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test obciążeniowy śledzenia postępu zadań")
+    parser.add_argument('--jobs', type=int, default=100)
+    parser.add_argument('--tabs', type=int, default=3, help="Liczba otwartych kart panelu")
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--fakeredis', action='store_true', help="Redis w pamięci (fakeredis) zamiast serwera z REDIS_URL")
+    args = parser.parse_args()
+
+    if args.fakeredis:
+        import fakeredis
+        global redis_conn
+        # Strona WWW (app.main) i symulowane zadania muszą korzystać z tego samego połączenia
+        redis_conn = web.redis_conn = fakeredis.FakeRedis()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config.update(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, 'bench.db'),
+                          UPLOAD_FOLDER=os.path.join(tmp, 'uploads'), OUTPUT_FOLDER=os.path.join(tmp, 'output'))
+        with app.app_context():
+            db.create_all()
+            job_ids = [f'bench-{i}' for i in range(args.jobs)]
+            db.session.add_all([Job(id=job_id, user_id='admin', status='processing') for job_id in job_ids])
+            db.session.commit()
+        for mode in ('polling', 'sse'):
+            print(json.dumps(run(mode, job_ids, args.tabs, args.duration)))
+        redis_conn.delete(*[state_key(job_id) for job_id in job_ids])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# benchmarks/bench_sampling.py
+# Czas dekodowania dla różnych wartości frame_skip: read() każdej klatki vs. FrameSampler (grab() + seek).
+# Użycie: python -m benchmarks.bench_sampling [--frames 3000] [--skips 0 4 29 149 599]
+
+import os
+import cv2
+import json
+import time
+import argparse
+import tempfile
+
+from app.sampling import FrameSampler
+from benchmarks.synthetic import load_world_map, write_synthetic_video
+
+
+def read_every_frame(video_path, frame_skip):
+    """Dotychczasowa pętla: pełne dekodowanie każdej klatki, a dopiero potem sprawdzenie frame_skip."""
+    cap = cv2.VideoCapture(video_path)
+    sampled, frame_number = 0, 0
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret: break
+        if frame_number % (frame_skip + 1) == 0: sampled += 1
+        frame_number += 1
+    cap.release()
+    return sampled
+
+
+def sampler_frames(video_path, frame_skip):
+    cap = cv2.VideoCapture(video_path)
+    sampled = sum(1 for _ in FrameSampler(cap, frame_skip + 1))
+    cap.release()
+    return sampled
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark próbkowania klatek po stronie dekodera")
+    parser.add_argument('--map', default='map.png')
+    parser.add_argument('--frames', type=int, default=3000)
+    parser.add_argument('--skips', type=int, nargs='+', default=[0, 4, 29, 149, 599])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video_path = os.path.join(tmp, 'video.mp4')
+        write_synthetic_video(video_path, load_world_map(args.map), args.frames)
+        for frame_skip in args.skips:
+            for name, method in (('read_every_frame', read_every_frame), ('frame_sampler', sampler_frames)):
+                start = time.perf_counter()
+                sampled = method(video_path, frame_skip)
+                elapsed = time.perf_counter() - start
+                print(json.dumps({"method": name, "frame_skip": frame_skip, "frames_sampled": sampled,
+                                  "seconds": elapsed, "video_frames_per_s": args.frames / elapsed}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+# benchmarks/bench_segmented.py
+# Przepustowość analizy wideo (klatki/s) w zależności od liczby procesów w trybie segmentowym.
+# Użycie: python -m benchmarks.bench_segmented [--frames 3000] [--workers 1 2 4 8]
+
+import os
+import cv2
+import json
+import time
+import argparse
+import tempfile
+
+from app import analysis
+from benchmarks.synthetic import load_world_map, write_synthetic_video
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark równoległej analizy segmentów wideo")
+    parser.add_argument('--map', default='map.png')
+    parser.add_argument('--frames', type=int, default=3000)
+    parser.add_argument('--frame-skip', type=int, default=0)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        map_path, video_path = os.path.join(tmp, 'map.png'), os.path.join(tmp, 'video.mp4')
+        world_map = load_world_map(args.map)
+        cv2.imwrite(map_path, world_map)
+        write_synthetic_video(video_path, world_map, args.frames)
+        analysis.SEGMENT_MIN_FRAMES = min(analysis.SEGMENT_MIN_FRAMES, max(args.frames // (2 * max(args.workers)), 1))
+
+        for workers in args.workers:
+            start = time.perf_counter()
+            if workers == 1:
+                results = analysis.iter_sequential_results(video_path, args.frame_skip, analysis.TibiaFrameAnalyzer(map_path))
+            else:
+                results = analysis.iter_segmented_results(video_path, args.frame_skip, workers, map_path)
+            analysed = sum(1 for _ in results)
+            elapsed = time.perf_counter() - start
+            print(json.dumps({"workers": workers, "frames_analysed": analysed, "seconds": elapsed,
+                              "frames_per_s": analysed / elapsed, "cpu_count": os.cpu_count()}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# benchmarks/synthetic.py
+# Generowanie syntetycznych danych testowych na potrzeby benchmarków (działa offline).
+
+import os
+import cv2
+import numpy as np
+
+# Rozmiar minimapy (px) oraz nazwy stworów pojawiających się na syntetycznej battle liście
+MINIMAP_SIZE = 150
+CREATURE_NAMES = ('Rat', 'Cave Rat', 'Troll', 'Orc Warrior', 'Dragon', 'Dragon Lord', 'Cyclops', 'Minotaur Archer', 'Hero', 'Necromancer')
+BATTLE_ROW_HEIGHT = 22
+
+
+def make_world_map(width=2560, height=2048, seed=0):
+    """Tworzy syntetyczną mapę przypominającą mapę Tibii: kafelki 1px/sqm w kilku kolorach terenu."""
+    rng = np.random.default_rng(seed)
+    palette = np.array([[40, 120, 40], [60, 90, 130], [150, 150, 150], [200, 90, 0], [30, 60, 90], [0, 200, 250]], dtype=np.uint8)
+    # Duże obszary terenu + drobne detale (ściany, drzewa, kamienie)
+    regions = rng.integers(0, len(palette), size=(height // 32 + 1, width // 32 + 1))
+    regions = cv2.resize(regions.astype(np.uint8), (width, height), interpolation=cv2.INTER_NEAREST)
+    world_map = palette[regions]
+    details = rng.random((height, width)) < 0.03
+    world_map[details] = rng.integers(0, 256, size=(int(details.sum()), 3), dtype=np.uint8)
+    return world_map
+
+
+def load_world_map(path='map.png', seed=0):
+    """Wczytuje prawdziwą mapę, jeśli istnieje, w przeciwnym razie zwraca mapę syntetyczną."""
+    if path and os.path.exists(path) and os.path.getsize(path) > 0:
+        world_map = cv2.imread(path)
+        if world_map is not None: return world_map
+    return make_world_map(seed=seed)
+
+
+def random_crops(world_map_gray, count, size=150, noise=0.0, seed=0):
+    """Losuje wycinki mapy (udające minimapę). Zwraca listę (crop, x, y)."""
+    rng = np.random.default_rng(seed)
+    h, w = world_map_gray.shape[:2]
+    crops = []
+    while len(crops) < count:
+        x, y = int(rng.integers(0, w - size)), int(rng.integers(0, h - size))
+        crop = world_map_gray[y:y + size, x:x + size]
+        if crop.std() < 5: continue  # Pomijamy jednolite obszary (woda, czerń) - nie da się ich zlokalizować
+        if noise:
+            crop = np.clip(crop + rng.normal(0, noise, crop.shape), 0, 255).astype(np.uint8)
+        crops.append((np.ascontiguousarray(crop), x, y))
+    return crops
+
+
+def random_walk(world_map_gray, frames, size=150, step=1, seed=0):
+    """Ścieżka gracza: lista pozycji (x, y) lewego górnego rogu minimapy, poruszającej się po mapie."""
+    rng = np.random.default_rng(seed)
+    h, w = world_map_gray.shape[:2]
+    (_, x, y), = random_crops(world_map_gray, 1, size=size, seed=seed)
+    direction = rng.integers(-1, 2, size=2)
+    path = []
+    for _ in range(frames):
+        if rng.random() < 0.05: direction = rng.integers(-1, 2, size=2)
+        x = int(np.clip(x + direction[0] * step, 0, w - size - 1))
+        y = int(np.clip(y + direction[1] * step, 0, h - size - 1))
+        path.append((x, y))
+    return path
+
+
+def render_battle_row(name, hp=100.0, target=False, width=150):
+    """Wiersz battle listy: nazwa, pasek HP pod nią i (dla celu ataku) jasny znacznik przy lewej krawędzi."""
+    row = np.full((BATTLE_ROW_HEIGHT, width, 3), 60, dtype=np.uint8)
+    cv2.putText(row, name, (6, 10), cv2.FONT_HERSHEY_PLAIN, 0.8, (255, 255, 255), 1)
+    row[12:15, 5:5 + int((width - 10) * hp / 100)] = (0, 200, 0)
+    if target: row[:, 0:3] = 255
+    return row
+
+
+def render_client_frame(world_map, x, y, hp=100.0, mana=100.0, creatures=(), width=800, height=600, size=MINIMAP_SIZE):
+    """Rysuje uproszczone okno klienta: minimapa w prawym górnym rogu, pod nią battle lista
+    (creatures: lista (nazwa, hp%) lub (nazwa, hp%, cel)), paski HP/many na dole."""
+    frame = np.full((height, width, 3), 20, dtype=np.uint8)
+    frame[10:10 + size, width - 160:width - 160 + size] = world_map[y:y + size, x:x + size]
+    for i, (name, creature_hp, *target) in enumerate(creatures):
+        top, left = 170 + i * BATTLE_ROW_HEIGHT, width - 160
+        frame[top:top + BATTLE_ROW_HEIGHT, left:left + 150] = render_battle_row(name, creature_hp, bool(target and target[0]))
+    frame[height - 30:height - 20, 10:10 + int(hp)] = (0, 0, 220)
+    frame[height - 20:height - 10, 10:10 + int(mana)] = (220, 0, 0)
+    return frame
+
+
+def write_synthetic_video(path, world_map, frames, fps=30, seed=0):
+    """Zapisuje syntetyczne nagranie rozgrywki. Zwraca ścieżkę gracza (ground truth)."""
+    world_map_gray = cv2.cvtColor(world_map, cv2.COLOR_BGR2GRAY)
+    walk = random_walk(world_map_gray, frames, seed=seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (800, 600))
+    for x, y in walk:
+        writer.write(render_client_frame(world_map, x, y))
+    writer.release()
+    return walk
+
+
+def session_script(frames, seed=0, max_creatures=5):
+    """Przebieg syntetycznej sesji klatka po klatce: HP i mana gracza (0-100) oraz battle lista,
+    na której pierwszy stwór jest celem ataku i traci HP. Zwraca listę {'hp', 'mana', 'creatures': [(nazwa, hp, cel)]}."""
+    rng = np.random.default_rng(seed)
+    hp, mana, creatures, script = 100, 100, [], []
+    for _ in range(frames):
+        # Średnio co 2 s (przy 30 kl./s) stwór pojawia się na liście albo z niej znika
+        if rng.random() < 1 / 60:
+            if creatures and (len(creatures) == max_creatures or rng.random() < 0.4): creatures.pop(int(rng.integers(len(creatures))))
+            else: creatures.append([str(rng.choice(CREATURE_NAMES)), 100])
+        if creatures and rng.random() < 0.1: creatures[0][1] = max(creatures[0][1] - int(rng.integers(1, 10)), 1)
+        if rng.random() < 0.1: hp = int(np.clip(hp + rng.integers(-8, 7), 5, 100))
+        if rng.random() < 0.1: mana = int(np.clip(mana + rng.integers(-10, 9), 0, 100))
+        script.append({'hp': hp, 'mana': mana, 'creatures': [(name, creature_hp, i == 0) for i, (name, creature_hp) in enumerate(creatures)]})
+    return script
+
+
+def write_session_video(path, world_map, frames, fps=30, seed=0):
+    """Zapisuje syntetyczne nagranie z ruchem po mapie, paskami HP/many i battle listą.
+    Zwraca ground truth klatek: {'x', 'y' (środek minimapy, jak w wynikach analizatora), 'hp', 'mana', 'creatures'}."""
+    world_map_gray = cv2.cvtColor(world_map, cv2.COLOR_BGR2GRAY)
+    walk = random_walk(world_map_gray, frames, seed=seed)
+    script = session_script(frames, seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (800, 600))
+    truth = []
+    for (x, y), state in zip(walk, script):
+        writer.write(render_client_frame(world_map, x, y, state['hp'], state['mana'], state['creatures']))
+        truth.append({'x': x + MINIMAP_SIZE // 2, 'y': y + MINIMAP_SIZE // 2, **state})
+    writer.release()
+    return truth
+
+
+class TemplateNameReader:
+    """Zastępca EasyOCR do pracy offline bez pobranych modeli (interfejs Reader.recognize):
+    rozpoznaje nazwy z CREATURE_NAMES przez porównanie z wzorcami wierszy render_battle_row."""
+    def __init__(self, names=CREATURE_NAMES):
+        self.names = list(names)
+        # Analizator przekazuje wiersze bez 5 pierwszych kolumn; porównujemy tylko pasek z nazwą (bez paska HP)
+        self.templates = np.stack([cv2.cvtColor(render_battle_row(name)[:12, 5:], cv2.COLOR_BGR2GRAY) for name in self.names]).astype(np.float32)
+
+    def recognize(self, image, horizontal_list=None, free_list=None, detail=1, batch_size=1):
+        results = []
+        for x0, x1, y0, y1 in horizontal_list or []:
+            strip = image[y0:y0 + 12, x0:x1].astype(np.float32)
+            width = min(strip.shape[1], self.templates.shape[2])
+            errors = np.abs(self.templates[:, :, :width] - strip[:, :width]).mean(axis=(1, 2))
+            results.append(([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], self.names[int(errors.argmin())], 1.0))
+        return results
@@ -1,19 +1,61 @@
 # worker.py
-# Uruchamia proces workera RQ, który nasłuchuje na zadania w kolejce Redis.
+# Uruchamia procesy workera RQ, które nasłuchują na zadania w kolejkach Redis.
 
 import os
+import multiprocessing
+from datetime import datetime
 from redis import Redis
 from rq import Worker, Queue, Connection
 
-# Ustawienie nasłuchiwania na domyślnej kolejce
-listen = ['default']
+from app.resources import get_shared_resources
+
+# Kolejki w kolejności priorytetu (short/long/bulk - app.scheduling).
+# 'default' obsługuje zadania zlecone przed podziałem na kolejki.
+listen = os.getenv('WORKER_QUEUES', 'short,long,bulk,default').split(',')
+# Liczba procesów workera słuchających tych kolejek - każdy wykonuje jedno zadanie naraz
+concurrency = int(os.getenv('WORKER_CONCURRENCY', '1'))
 
 # Połączenie z serwerem Redis
 # Nazwa hosta 'redis' jest zdefiniowana w docker-compose.yml
 redis_url = os.getenv('REDIS_URL', 'redis://redis:6379')
 conn = Redis.from_url(redis_url)
+# Start bieżącego uruchomienia - wcześniejsze rejestracje workerów z tego hosta mogą należeć do poprzedniego
+started_at = datetime.utcnow()
 
-if __name__ == '__main__':
+
+def work():
     with Connection(conn):
         worker = Worker(map(Queue, listen))
         worker.work()
+
+
+def requeue_interrupted():
+    """Wznawia zadania przerwane razem z poprzednim uruchomieniem workera (np. restart kontenerów przez cron):
+    zadania ze statusem 'processing', których nie wykonuje żaden żyjący worker, wracają do swoich kolejek
+    i kontynuują analizę od punktu kontrolnego."""
+    from app.analysis import app, Job
+    from app.scheduling import clean_stale_workers, requeue_interrupted_jobs
+    # Poza blokadą wznawiania - każdy uruchamiany worker sprząta po martwych workerach
+    removed = clean_stale_workers(conn, started_at)
+    if removed: print(f"Wyrejestrowano martwe workery: {removed}")
+    with app.app_context():
+        rq_job_ids = {job.rq_job_id for job in Job.query.filter(Job.status == 'processing', Job.rq_job_id.isnot(None))}
+    for rq_job_id in requeue_interrupted_jobs(conn, rq_job_ids):
+        print(f"Wznowiono przerwane zadanie {rq_job_id}")
+
+
+if __name__ == '__main__':
+    # Wczytaj mapę, indeks mapy, model OCR i szablony raz, w procesie głównym workera.
+    # RQ uruchamia każde zadanie w procesie potomnym (fork), który dziedziczy gotowe zasoby.
+    if os.getenv('PRELOAD_RESOURCES', '1') == '1':
+        import app.analysis  # noqa: F401 - moduł zadania również importujemy tylko raz
+        resources = get_shared_resources(os.getenv('WORLD_MAP_PATH', 'map.png'))
+        print(f"Zasoby analizatora wczytane w {resources.load_time:.1f} s")
+    requeue_interrupted()
+    if concurrency == 1:
+        work()
+    else:
+        # Procesy workerów powstają przez fork() po wczytaniu zasobów i dzielą ich strony pamięci
+        processes = [multiprocessing.Process(target=work) for _ in range(concurrency)]
+        for process in processes: process.start()
+        for process in processes: process.join()